@@ -38,7 +38,7 @@ def create_app():
             "x-token",
             "token",
         ],
-        expose_headers=["Content-Disposition"],
+        expose_headers=["Content-Disposition", "Content-Range", "Accept-Ranges", "Content-Length", "ETag"],
         max_age=86400,
     )
 
@@ -58,4 +58,109 @@ def create_app():
     # 5) 初始化 socket.io 事件
     init_socketio(socketio)
 
+    # 6) 后台任务与运维命令：这里只注册命令，工作线程由 start_background 在服务进程里启动
+    init_background(app)
+    init_commands(app)
+
     return app
+
+def init_commands(app):
+    import click
+    from app.services.blob_rebalancer import BlobRebalancer
+
+    @app.cli.command("rebalance-blobs")
+    @click.option("--dry-run", is_flag=True, help="只统计需要迁移的 Blob，不移动文件")
+    @click.option("--limit", type=int, default=None, help="本次最多迁移多少个 Blob")
+    def rebalance_blobs(dry_run, limit):
+        """调整 STORAGE_ROOTS 后把 Blob 迁到新的目标根目录"""
+        print(BlobRebalancer().run(dry_run=dry_run, limit=limit))
+
+def init_background(app):
+    import threading
+    from app.api.files import svc
+    from app.services.upload_reaper import UploadReaper
+    from app.services.blob_reclaimer import BlobReclaimer
+    from app.services.pack_compactor import PackCompactor
+    from app.services import commit_jobs
+    from app.services.integrity_scrubber import IntegrityScrubber
+    from app.services.cdc_chunker import CdcChunker
+    from app.services.precompressor import Precompressor
+    from app.vendors.settings import Settings
+
+    reaper = UploadReaper(file_service=svc)
+    reclaimer = BlobReclaimer(file_service=svc)
+    compactor = PackCompactor()
+    scrubber = IntegrityScrubber()
+    chunker = CdcChunker()
+    precompressor = Precompressor()
+    app.extensions["background_jobs"] = {
+        "reaper": reaper, "reclaimer": reclaimer, "compactor": compactor, "scrubber": scrubber, "chunker": chunker,
+        "precompressor": precompressor,
+    }
+
+    @app.cli.command("reap-uploads")
+    def reap_uploads():
+        """回收过期的分片会话与孤儿临时文件"""
+        print(reaper.run_once())
+
+    @app.cli.command("reclaim-blobs")
+    def reclaim_blobs():
+        """回收已删除文件占用的磁盘空间"""
+        print(reclaimer.run_once())
+
+    @app.cli.command("compact-packs")
+    def compact_packs():
+        """重写有效数据占比过低的小文件包，释放已删除对象的空间"""
+        print(compactor.run_once())
+
+    @app.cli.command("scrub-blobs")
+    def scrub_blobs():
+        """按限速重读并校验到期的 Blob（大小与 sha256）"""
+        print(scrubber.run_once())
+
+    @app.cli.command("cdc-chunk")
+    def cdc_chunk():
+        """把达到 CDC_MIN_FILE_SIZE 的整文件内容转为分块存储（跨版本去重）"""
+        print(chunker.run_once())
+
+    @app.cli.command("precompress-blobs")
+    def precompress_blobs():
+        """为尚未处理的文本类 Blob 生成 .br / .gz 预压缩变体"""
+        print(precompressor.run_once())
+
+    @app.cli.command("commit-worker")
+    def commit_worker():
+        """以前台进程运行异步提交工作池（Web 进程设置 BACKGROUND_WORKERS=0 时使用）"""
+        commit_jobs.start_runner(app, svc).join()
+
+    @app.cli.command("run-workers")
+    def run_workers():
+        """以前台进程运行全部后台任务（Web 进程设置 BACKGROUND_WORKERS=0 或不经 run.py 启动时使用）"""
+        start_background(app)
+        threading.Event().wait()
+
+def start_background(app):
+    """
+    启动提交工作池与各周期任务。只由服务进程调用（run.py 的实际服务子进程、flask run-workers），
+    不放在 create_app 里：CLI 命令与 reloader 父进程也会 create_app，在那里启动会重复运行、
+    短命进程还会认领提交任务后退出。同一 app 重复调用无效。
+    """
+    from app.api.files import svc
+    from app.services.background import start_worker
+    from app.services import commit_jobs
+    from app.vendors.settings import Settings
+
+    if app.extensions.get("background_started"):
+        return
+    app.extensions["background_started"] = True
+    jobs = app.extensions["background_jobs"]
+    commit_jobs.start_runner(app, svc)
+    start_worker(app, "upload-reaper", Settings.REAPER_INTERVAL, jobs["reaper"].run_once)
+    start_worker(app, "blob-reclaimer", Settings.RECLAIM_INTERVAL, jobs["reclaimer"].run_once)
+    start_worker(app, "integrity-scrubber", Settings.SCRUB_INTERVAL, jobs["scrubber"].run_once)
+    if Settings.PRECOMPRESS_ENABLED:
+        start_worker(app, "precompressor", Settings.PRECOMPRESS_INTERVAL, jobs["precompressor"].run_once)
+    if Settings.PACK_ENABLED:
+        start_worker(app, "pack-compactor", Settings.PACK_COMPACT_INTERVAL, jobs["compactor"].run_once)
+    if Settings.CDC_ENABLED:
+        start_worker(app, "cdc-chunker", Settings.CDC_INTERVAL, jobs["chunker"].run_once)
@@ -1,40 +1,29 @@
-from flask import Blueprint, request, send_file
+from flask import Blueprint, Response, request
+from urllib.parse import quote
 from werkzeug.datastructures import FileStorage
 from pathlib import Path
-from datetime import datetime, timezone
 import os
+import mimetypes
 
 from app.services.file_service import FileService
-from app.schemas.file_schema import UploadInitSchema, UploadCommitSchema, load_and_validate
-from app.models.file import FileStatusEnum
+from app.services import commit_jobs
+from app.schemas.file_schema import (
+    UploadInitSchema, UploadCommitSchema, UploadPrecheckSchema,
+    UploadBatchInitSchema, UploadBatchCommitSchema, FileBulkDeleteSchema, FileArchiveSchema,
+    CdcMissingSchema, CdcCommitSchema, load_and_validate,
+)
+from app.models import read_replica
+from app.models.file import FileEntry, FileStatusEnum, CommitJobStatusEnum, IntegrityEnum
+from app.vendors.settings import Settings
+from app.vendors import image_derivatives, batch_frames, zip_stream
+from app.vendors.precompress import variant_path
 from utils.response import success_response, error_response  # 复用你的工具
+from utils.file_response import send_stored_file, not_modified_response
+from utils.pagination import paginate_keyset
 
 file_bp = Blueprint("file", __name__, url_prefix="/api")
 svc = FileService()
 
-# -------------------------
-# 工具：安全生成 last_modified（优先用磁盘 mtime，回退到 created_at）
-# -------------------------
-def _safe_last_modified(path: Path, created_at) -> datetime | None:
-    try:
-        # 1) 优先使用文件真实 mtime（转为 UTC）
-        mtime = path.stat().st_mtime
-        return datetime.fromtimestamp(mtime, tz=timezone.utc)
-    except Exception:
-        pass
-
-    # 2) 回退：created_at 可能是 datetime 或 str
-    if isinstance(created_at, datetime):
-        return created_at if created_at.tzinfo else created_at.replace(tzinfo=timezone.utc)
-    if isinstance(created_at, str):
-        # 尝试解析 ISO 字符串；失败就返回 None（不传 last_modified）
-        try:
-            dt = datetime.fromisoformat(created_at)
-            return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
-        except Exception:
-            return None
-    return None
-
 # -------------------------
 # 单次上传
 # -------------------------
@@ -53,18 +42,80 @@ def upload_file():
         return error_response(f"上传失败: {str(e)}")
 
 # -------------------------
-# 分片上传：创建会话
+# 单次上传（原始请求体）：PUT /api/upload?filename=xx，body 为 application/octet-stream
+#     直接消费 request.stream，跳过 multipart 解析与 werkzeug 的临时文件
+# -------------------------
+def _raw_body_error():
+    if request.mimetype.startswith("multipart/"):
+        return error_response("原始上传请使用 application/octet-stream 请求体")
+    return None
+
+@file_bp.route("/upload", methods=["PUT"])
+def upload_file_raw():
+    try:
+        bad = _raw_body_error()
+        if bad:
+            return bad
+        filename = request.args.get("filename")
+        if not filename:
+            return error_response("缺少查询参数 filename")
+        content_type = (
+            request.args.get("content_type")
+            or mimetypes.guess_type(filename)[0]
+            or "application/octet-stream"
+        )
+        entry = svc.stream_upload(request.stream, filename, content_type, request.args.get("note"))
+        data = svc._file_to_dict(entry, request_base_url=request.base_url.replace(request.path, ""))
+        return success_response(data=data, msg="上传成功")
+    except Exception as e:
+        return error_response(f"上传失败: {str(e)}")
+
+# -------------------------
+# 秒传预检：只查询，不登记
+# -------------------------
+@file_bp.route("/uploads/precheck", methods=["POST"])
+def precheck_upload():
+    try:
+        payload = load_and_validate(UploadPrecheckSchema(), request.get_json())
+        if not payload.get("sha256"):
+            # 只给指纹：may_exist 为 False 时客户端无需计算整文件 sha256，直接上传
+            may_exist = svc.may_exist(payload["size"], payload["fingerprint"])
+            data = {"exists": False, "may_exist": may_exist, "file": None}
+            return success_response(data=data, msg="查询成功")
+        row = svc.find_by_content(payload["size"], payload["sha256"])
+        data = {"exists": row is not None, "may_exist": row is not None, "file": svc._file_to_dict(row) if row else None}
+        return success_response(data=data, msg="查询成功")
+    except ValueError as ve:
+        return error_response(str(ve))
+    except Exception as e:
+        return error_response(f"预检失败: {str(e)}")
+
+# -------------------------
+# 分片上传：创建会话（命中已有内容时直接秒传）
 # -------------------------
 @file_bp.route("/uploads/initiate", methods=["POST"])
 def initiate_upload():
     try:
         payload = load_and_validate(UploadInitSchema(), request.get_json())
+        entry = svc.instant_upload(
+            filename=payload["filename"],
+            expected_size=payload.get("expected_size"),
+            expected_sha256=payload.get("expected_sha256"),
+            content_type=payload.get("content_type"),
+            note=payload.get("note"),
+        )
+        if entry:
+            data = {"upload_id": None, "instant": True, "file": svc._file_to_dict(entry)}
+            return success_response(data=data, msg="秒传成功")
+
         upload_id = svc.initiate_upload(
             filename=payload["filename"],
             expected_size=payload.get("expected_size"),
             expected_sha256=payload.get("expected_sha256"),
+            chunk_size=payload.get("chunk_size"),
         )
-        return success_response(data={"upload_id": upload_id}, msg="创建分片会话成功")
+        data = {"upload_id": upload_id, "chunk_size": payload.get("chunk_size") or Settings.CHUNK_SIZE, "instant": False}
+        return success_response(data=data, msg="创建分片会话成功")
     except ValueError as ve:
         return error_response(str(ve))
     except Exception as e:
@@ -88,17 +139,109 @@ def put_chunk(upload_id: str):
     except Exception as e:
         return error_response(f"分片上传失败: {str(e)}")
 
+# -------------------------
+# 分片上传：写入某片（原始请求体），sha256 可选放在查询参数
+# -------------------------
+@file_bp.route("/uploads/<upload_id>/chunk/<int:index>", methods=["PUT"])
+def put_chunk_raw(upload_id: str, index: int):
+    try:
+        bad = _raw_body_error()
+        if bad:
+            return bad
+        status = svc.put_chunk_stream(
+            upload_id=upload_id, index=index, stream=request.stream,
+            chunk_sha256=request.args.get("sha256"),
+        )
+        return success_response(data=status, msg="分片上传成功")
+    except Exception as e:
+        return error_response(f"分片上传失败: {str(e)}")
+
+# -------------------------
+# 批量：一次创建多个会话 / 一个请求体写入多个分片 / 一次提交多个会话
+# -------------------------
+@file_bp.route("/uploads/batch/initiate", methods=["POST"])
+def initiate_uploads_batch():
+    try:
+        payload = load_and_validate(UploadBatchInitSchema(), request.get_json())
+        results = svc.initiate_uploads(payload["items"])
+        data = [
+            {
+                "upload_id": r["upload_id"],
+                "chunk_size": r["chunk_size"],
+                "instant": r["instant"],
+                "file": svc._file_to_dict(r["entry"]) if r["entry"] is not None else None,
+            }
+            for r in results
+        ]
+        return success_response(data=data, msg="批量创建成功")
+    except ValueError as ve:
+        return error_response(str(ve))
+    except Exception as e:
+        return error_response(f"批量创建失败: {str(e)}")
+
+@file_bp.route("/uploads/batch/chunks", methods=["PUT"])
+def put_chunks_batch():
+    # 请求体格式见 app.vendors.batch_frames
+    try:
+        bad = _raw_body_error()
+        if bad:
+            return bad
+        data = svc.put_chunks_batch(batch_frames.iter_frames(request.stream, Settings.BATCH_MAX_ITEMS))
+        return success_response(data=data, msg="批量分片上传完成")
+    except Exception as e:
+        return error_response(f"批量分片上传失败: {str(e)}")
+
+@file_bp.route("/uploads/batch/commit", methods=["POST"])
+def commit_uploads_batch():
+    try:
+        payload = load_and_validate(UploadBatchCommitSchema(), request.get_json())
+        results = svc.commit_uploads(payload["items"])
+        data = [
+            {"upload_id": r["upload_id"], "file": svc._file_to_dict(r["entry"])}
+            if "entry" in r else {"upload_id": r["upload_id"], "error": r["error"]}
+            for r in results
+        ]
+        return success_response(data=data, msg="批量提交完成")
+    except ValueError as ve:
+        return error_response(str(ve))
+    except Exception as e:
+        return error_response(f"批量提交失败: {str(e)}")
+
 # -------------------------
 # 分片上传：提交合并
 # -------------------------
+def _wants_async() -> bool:
+    # ?async=1 或 RFC 7240 的 Prefer: respond-async
+    return request.args.get("async") in ("1", "true") or "respond-async" in request.headers.get("Prefer", "")
+
+def _job_to_dict(job) -> dict:
+    data = {
+        "job_id": job.id,
+        "upload_id": job.upload_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "error": job.error,
+        "file": None,
+    }
+    if job.status == CommitJobStatusEnum.succeeded and job.file_id is not None:
+        row = svc.get_file(job.file_id)
+        data["file"] = svc._file_to_dict(row) if row else None
+    return data
+
 @file_bp.route("/uploads/<upload_id>/commit", methods=["POST"])
 def commit_upload(upload_id: str):
     try:
         payload = load_and_validate(UploadCommitSchema(), request.get_json())
+        if _wants_async():
+            # 只登记任务，校验/合并/入库由后台工作池执行，客户端轮询 /uploads/jobs/<job_id>
+            job = svc.enqueue_commit(upload_id, payload)
+            commit_jobs.notify()
+            return success_response(data=_job_to_dict(job), msg="已受理", code=202)
         entry = svc.commit_upload(
             upload_id=upload_id,
             expected_size=payload.get("expected_size"),
             expected_sha256=payload.get("expected_sha256"),
+            expected_merkle_root=payload.get("expected_merkle_root"),
             content_type=payload.get("content_type"),
             note=payload.get("note"),
         )
@@ -111,6 +254,24 @@ def commit_upload(upload_id: str):
     except Exception as e:
         return error_response(f"提交失败: {str(e)}")
 
+@file_bp.route("/uploads/jobs/<job_id>", methods=["GET"])
+def get_commit_job(job_id: str):
+    job = svc.get_commit_job(job_id)
+    if not job:
+        return error_response("任务不存在")
+    return success_response(data=_job_to_dict(job), msg="查询成功")
+
+# -------------------------
+# 分片上传：断点续传清单
+# -------------------------
+@file_bp.route("/uploads/<upload_id>", methods=["GET"])
+def get_upload_manifest(upload_id: str):
+    # 续传前先取清单：chunk_ranges/byte_ranges 为已接收区间（左闭右开），其余部分需要重传
+    try:
+        return success_response(data=svc.get_upload_manifest(upload_id), msg="获取成功")
+    except Exception as e:
+        return error_response(f"获取失败: {str(e)}")
+
 # -------------------------
 # 分片上传：取消会话
 # -------------------------
@@ -122,14 +283,70 @@ def abort_upload(upload_id: str):
     except Exception as e:
         return error_response(f"取消失败: {str(e)}")
 
+# -------------------------
+# 分块去重上传：客户端按内容切分，先问服务端缺哪些分块，只上传缺失的，最后按清单提交
+# -------------------------
+@file_bp.route("/uploads/cdc/missing", methods=["POST"])
+def cdc_missing_chunks():
+    try:
+        if not Settings.CDC_ENABLED:
+            return error_response("未开启分块去重存储")
+        payload = load_and_validate(CdcMissingSchema(), request.get_json())
+        return success_response(data={"missing": svc.missing_chunks(payload["chunks"])}, msg="查询成功")
+    except ValueError as ve:
+        return error_response(str(ve))
+    except Exception as e:
+        return error_response(f"查询失败: {str(e)}")
+
+@file_bp.route("/uploads/cdc/chunks/<string(length=64):sha256_hex>", methods=["PUT"])
+def cdc_put_chunk(sha256_hex: str):
+    try:
+        if not Settings.CDC_ENABLED:
+            return error_response("未开启分块去重存储")
+        bad = _raw_body_error()
+        if bad:
+            return bad
+        return success_response(data=svc.put_cdc_chunk(sha256_hex, request.stream), msg="分块上传成功")
+    except ValueError as ve:
+        return error_response(str(ve))
+    except Exception as e:
+        return error_response(f"分块上传失败: {str(e)}")
+
+@file_bp.route("/uploads/cdc/commit", methods=["POST"])
+def cdc_commit():
+    try:
+        payload = load_and_validate(CdcCommitSchema(), request.get_json())
+        row = svc.commit_chunked(
+            filename=payload["filename"],
+            chunk_hashes=payload["chunks"],
+            expected_sha256=payload["sha256"],
+            content_type=payload.get("content_type"),
+            note=payload.get("note"),
+        )
+        return success_response(data=svc._file_to_dict(row), msg="提交成功")
+    except ValueError as ve:
+        return error_response(str(ve))
+    except Exception as e:
+        return error_response(f"提交失败: {str(e)}")
+
 # -------------------------
 # 文件管理
 # -------------------------
 @file_bp.route("/files", methods=["GET"])
 def list_files():
-    rows = svc.list_files()
+    # 游标分页：?pageSize=&cursor=<上一页 next_cursor>&total=exact|approx
+    try:
+        rows, next_cursor, total = read_replica(
+            paginate_keyset, svc.active_files_query(), (FileEntry.created_at, FileEntry.id)
+        )
+    except ValueError as e:
+        return error_response(str(e))
     base = request.base_url.replace(request.path, "")
-    data = [svc._file_to_dict(r, base) for r in rows]
+    data = {
+        "list": [svc._file_to_dict(r, base) for r in rows],
+        "next_cursor": next_cursor,
+        "total": total,
+    }
     return success_response(data=data, msg="查询成功")
 
 @file_bp.route("/files/<int:file_id>", methods=["GET"])
@@ -140,32 +357,182 @@ def get_file(file_id: int):
     data = svc._file_to_dict(row, request.base_url.replace(request.path, ""))
     return success_response(data=data, msg="查询成功")
 
+@file_bp.route("/files/archive", methods=["GET", "POST"])
+def download_archive():
+    # POST {"ids": [...]} 或 {"since", "until", "content_type"}；GET ?ids=1,2,3 便于直接做下载链接
+    if request.method == "GET":
+        body = {k: v for k, v in request.args.items() if k != "ids"}
+        if request.args.get("ids"):
+            try:
+                body["ids"] = [int(x) for x in request.args["ids"].split(",") if x]
+            except ValueError:
+                return error_response("ids 必须是逗号分隔的整数")
+    else:
+        body = request.get_json()
+    try:
+        payload = load_and_validate(FileArchiveSchema(), body)
+        members = svc.archive_members(
+            ids=payload.get("ids"),
+            since=payload.get("since"),
+            until=payload.get("until"),
+            content_type=payload.get("content_type"),
+        )
+    except ValueError as ve:
+        return error_response(str(ve))
+    except Exception as e:
+        return error_response(f"打包失败: {str(e)}")
+    if not members:
+        return error_response("没有可打包的文件")
+
+    name = payload.get("name") or "files.zip"
+    if not name.lower().endswith(".zip"):
+        name += ".zip"
+    # 边读边压边发，长度未知，走分块传输
+    rv = Response(zip_stream.iter_zip(members), mimetype="application/zip", direct_passthrough=True)
+    rv.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(name, safe='')}"
+    rv.headers["Cache-Control"] = "no-store"
+    return rv
+
+@file_bp.route("/files/<int:file_id>", methods=["DELETE"])
+def delete_file(file_id: int):
+    try:
+        deleted = svc.delete_files([file_id])
+    except Exception as e:
+        return error_response(f"删除失败: {str(e)}")
+    if not deleted:
+        return error_response("未找到文件")
+    return success_response(data={"id": file_id}, msg="删除成功")
+
+@file_bp.route("/files/delete", methods=["POST"])
+def delete_files_bulk():
+    # 批量删除：{"ids": [...]}，不存在或已删除的 id 忽略，返回实际删除的 id
+    try:
+        payload = load_and_validate(FileBulkDeleteSchema(), request.get_json())
+    except ValueError as e:
+        return error_response(str(e))
+    try:
+        deleted = svc.delete_files(payload["ids"])
+    except Exception as e:
+        return error_response(f"删除失败: {str(e)}")
+    return success_response(data={"deleted": deleted}, msg="删除成功")
+
+# -------------------------
+# 下载响应公共部分：Range / 零拷贝 / 代理卸载见 utils.file_response
+#     元数据来自 FileService 的进程内缓存，热资源不查库、不 stat；
+#     未命中时读主库：从库的滞后行一旦写进缓存，刚删除的文件会在整个 TTL 内继续可下载
+# -------------------------
+BLOB_MAX_AGE = 365 * 24 * 3600
+
+def _pick_encoding(meta):
+    """在预压缩变体里按客户端 Accept-Encoding 选一个；Range 请求与代理卸载模式下始终发原文"""
+    if not meta.encodings or "Range" in request.headers or Settings.SENDFILE_BACKEND:
+        return None
+    accepted = request.accept_encodings
+    best, best_q = None, 0
+    for encoding, size in meta.encodings:
+        q = accepted[encoding]
+        if q > best_q:
+            best, best_q = (encoding, size), q
+    return best
+
+def _unavailable(meta) -> bool:
+    # 存在性/完整性由后台巡检记录，请求路径不再 stat；巡检未覆盖时打开失败同样按缺失处理
+    return meta.integrity in (IntegrityEnum.missing, IntegrityEnum.corrupt)
+
+def _send_meta(meta, as_attachment: bool, immutable: bool = False):
+    if _unavailable(meta):
+        return None
+    # ETag 直接用存储的 sha256：重新校验的请求在碰磁盘之前就以 304 返回
+    path, size, etag = Path(meta.storage_path), meta.size, meta.sha256
+    encoding, encoded_size = _pick_encoding(meta) or (None, None)
+    if encoding:
+        path, size, etag = variant_path(path, encoding), encoded_size, f"{meta.sha256}-{encoding}"
+    try:
+        return send_stored_file(
+            path,
+            size=size,
+            mimetype=meta.content_type or "application/octet-stream",
+            as_attachment=as_attachment,
+            download_name=meta.original_name if as_attachment else None,
+            last_modified=meta.last_modified,
+            etag=etag,
+            max_age=BLOB_MAX_AGE if immutable else 3600,
+            immutable=immutable,
+            content_encoding=encoding,
+            vary="Accept-Encoding" if meta.encodings else None,
+            offset=meta.pack_offset,
+            segments=meta.segments,
+        )
+    except FileNotFoundError:
+        svc.invalidate_meta(meta)
+        return None
+
+@file_bp.route("/stats/buffers", methods=["GET"])
+def buffer_stats():
+    # 本进程上传/哈希缓冲池的使用情况：overflow 持续增长说明 BUFFER_POOL_MAX 偏小
+    return success_response(data=svc.buffer_stats(), msg="查询成功")
+
 # -------------------------
 # 下载：附件方式（浏览器触发下载）
 # -------------------------
 @file_bp.route("/download/<int:file_id>", methods=["GET"])
 def download_file(file_id: int):
-    row = svc.get_file(file_id)
-    if not row:
+    meta = svc.get_file_meta(file_id)
+    if not meta or meta.status != FileStatusEnum.active:
         return error_response("文件不存在")
-    path = Path(row.storage_path)
-    if not path.exists():
+    rv = _send_meta(meta, as_attachment=True)
+    if rv is None:
         return error_response("磁盘缺失")
+    return rv
 
-    last_modified = _safe_last_modified(path, getattr(row, "created_at", None))
+def _send_public(meta, immutable: bool = False):
+    """直链/内容寻址访问：带 width/height/fit/format/quality 参数且为位图时返回派生图"""
+    if not image_derivatives.wants_derivative(request.args):
+        return _send_meta(meta, as_attachment=False, immutable=immutable)
+    if _unavailable(meta):
+        return None
+    if not (meta.content_type or "").startswith("image/") or meta.content_type == "image/svg+xml":
+        return error_response("仅位图支持缩放/转码参数")
+    try:
+        params = image_derivatives.parse_params(request.args, meta.content_type, Settings.IMAGE_MAX_DIMENSION)
+    except ValueError as ve:
+        return error_response(str(ve))
 
-    kwargs = dict(
-        as_attachment=True,
-        download_name=row.original_name,
-        mimetype=row.content_type or "application/octet-stream",
-        conditional=True,
-        etag=True,
-        max_age=3600,
+    etag = f"{meta.sha256}-{params.tag}"
+    max_age = BLOB_MAX_AGE if immutable else 3600
+    not_modified = not_modified_response(etag, meta.last_modified, max_age, immutable)
+    if not_modified is not None:
+        return not_modified
+    try:
+        path = svc.get_derivative(meta, params)
+    except FileNotFoundError:
+        svc.invalidate_meta(meta)
+        return error_response("磁盘缺失")
+    except Exception as e:
+        return error_response(f"生成派生图失败: {str(e)}")
+    return send_stored_file(
+        path, size=path.stat().st_size, mimetype=params.mimetype,
+        last_modified=meta.last_modified, etag=etag, max_age=max_age, immutable=immutable,
     )
-    if last_modified is not None:
-        kwargs["last_modified"] = last_modified
 
-    return send_file(str(path), **kwargs)
+# -------------------------
+# 内容寻址直链：/api/blob/<sha256>，内容永不变化，返回 immutable 缓存头
+# -------------------------
+@file_bp.route("/blob/<string(length=64):sha256_hex>", methods=["GET"])
+def blob_by_hash(sha256_hex: str):
+    # 先确认内容仍被有效条目引用（热资源走元数据缓存，不查库），已删除或从未上传的不回 304
+    meta = svc.get_blob_meta(sha256_hex)
+    if not meta:
+        return error_response("文件不存在")
+    if not image_derivatives.wants_derivative(request.args):
+        # URL 本身就是校验值，命中时不用再看存储状态
+        not_modified = not_modified_response(sha256_hex.lower(), max_age=BLOB_MAX_AGE, immutable=True)
+        if not_modified is not None:
+            return not_modified
+    rv = _send_public(meta, immutable=True)
+    if rv is None:
+        return error_response("磁盘缺失")
+    return rv
 
 # -------------------------
 # 直链预览：inline（不强制下载，可用于 <img src> / 浏览器预览）
@@ -174,37 +541,13 @@ def download_file(file_id: int):
 @file_bp.route("/p/<path:public_name>", methods=["GET"])
 @file_bp.route("/<path:public_name>", methods=["GET"])
 def public_by_name(public_name: str):
-    from app.models.file import FileEntry, FileStatusEnum
-    row = FileEntry.query.filter_by(public_name=public_name).first()
-    if not row:
+    meta = svc.get_public_meta(public_name)
+    if not meta:
         return error_response("Public file not found")
-
-    status_val = getattr(row, "status", None)
-    is_active = False
-    try:
-        is_active = (status_val == FileStatusEnum.active)
-    except Exception:
-        pass
-    if not is_active:
-        is_active = str(status_val).lower() == "active"
-    if not is_active:
+    if str(meta.status).lower() != FileStatusEnum.active:
         return error_response("File not active")
 
-    path = Path(row.storage_path)
-    if not path.exists():
+    rv = _send_public(meta)
+    if rv is None:
         return error_response("File missing on disk")
-
-    # 复用你之前的 _safe_last_modified 逻辑
-    last_modified = _safe_last_modified(path, getattr(row, "created_at", None))
-
-    kwargs = dict(
-        as_attachment=False,
-        mimetype=row.content_type or "application/octet-stream",
-        conditional=True,
-        etag=True,
-        max_age=3600,
-    )
-    if last_modified is not None:
-        kwargs["last_modified"] = last_modified
-
-    return send_file(str(path), **kwargs)
\ No newline at end of file
+    return rv
@@ -1,8 +1,9 @@
 from flask import Blueprint, request
 from marshmallow import ValidationError
+from app.models import read_replica, replica_first
 from app.models.user import User
 from utils.response import success_response, error_response
-from utils.pagination import paginate
+from utils.pagination import paginate, paginate_keyset
 from app.schemas.user_schema import UserSchema, load_and_validate
 from app.services.user_service import create_user, update_user_info, delete_user_by_id
 
@@ -29,16 +30,29 @@ def register():
 @user_bp.route('/user/list', methods=['GET'])
 def get_users():
     query = User.query
-    users, total = paginate(query)
+    if request.args.get('pageNum') is not None:
+        # 兼容旧的 pageNum/pageSize 页码分页
+        users, total = read_replica(paginate, query)
+        return success_response({
+            "list": [user.to_dict() for user in users],
+            "total": total
+        })
+
+    # 游标分页：?pageSize=&cursor=<上一页 next_cursor>&total=exact|approx
+    try:
+        users, next_cursor, total = read_replica(paginate_keyset, query, (User.id,), descending=False)
+    except ValueError as e:
+        return error_response(str(e))
     return success_response({
         "list": [user.to_dict() for user in users],
+        "next_cursor": next_cursor,
         "total": total
     })
 
 # 查询单个用户
 @user_bp.route('/user/<int:user_id>', methods=['GET'])
 def get_user(user_id):
-    user = User.query.filter_by(user_id=user_id).first()
+    user = replica_first(lambda: User.query.filter_by(user_id=user_id).first())
     if not user:
         return error_response('用户不存在')
     return success_response(user.to_dict())
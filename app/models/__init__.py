@@ -1,3 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
 
-db = SQLAlchemy()
\ No newline at end of file
+from app.models.routing import RoutingSession, read_only, read_replica, replica_first
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
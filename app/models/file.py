@@ -8,6 +8,12 @@ class UploadStatusEnum(str):
     committed = "committed"
     aborted = "aborted"
 
+class CommitJobStatusEnum(str):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
 class FileStatusEnum(str):
     active = "active"
     deleted = "deleted"
@@ -20,10 +26,49 @@ class FileEntry(db.Model):
     content_type = db.Column(db.String(255), nullable=True)
     size = db.Column(db.BigInteger, nullable=False)
     sha256 = db.Column(db.String(64), nullable=False, index=True)
-    storage_path = db.Column(db.Text, nullable=False, unique=True)
+    storage_path = db.Column(db.Text, nullable=False)  # 多个条目可指向同一个 Blob
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     status = db.Column(db.String(16), default=FileStatusEnum.active, nullable=False)
     note = db.Column(db.Text, nullable=True)
+    # 删除后由后台回收任务释放对 Blob 的引用，释放完成置 True，见 app.services.blob_reclaimer
+    reclaimed = db.Column(db.Boolean, default=False, nullable=False)
+
+    # 列表按 (created_at, id) 游标分页，见 utils.pagination.paginate_keyset
+    __table_args__ = (
+        db.Index("ix_file_status_created", "status", "created_at", "id"),
+        db.Index("ix_file_status_reclaimed", "status", "reclaimed"),
+    )
+
+class PublicNameCounter(db.Model):
+    """同名文件的后缀计数器：public_name 冲突时按 base_name 取下一个 -N 后缀"""
+    __tablename__ = "public_name_counters"
+    base_name = db.Column(db.String(512), primary_key=True)
+    next_suffix = db.Column(db.Integer, default=1, nullable=False)
+
+class IntegrityEnum(str):
+    ok = "ok"
+    missing = "missing"
+    corrupt = "corrupt"
+
+class Blob(db.Model):
+    """按 sha256 内容寻址的物理文件，refcount 为引用它的 FileEntry 数"""
+    __tablename__ = "blobs"
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    storage_path = db.Column(db.Text, nullable=False)
+    pack_offset = db.Column(db.BigInteger, nullable=True)  # 非空表示打包存储：storage_path 为包文件，内容在 [偏移, 偏移+size)
+    chunked = db.Column(db.Boolean, default=False, nullable=False)  # 分块存储：内容由 BlobChunk 清单按序拼接，storage_path 仅作标识
+    refcount = db.Column(db.Integer, default=0, nullable=False)
+    encodings = db.Column(db.String(64), nullable=True)  # 预压缩变体，如 "br:123,gzip:456"
+    precompressed = db.Column(db.Boolean, default=False, nullable=False)  # 后台已处理过预压缩（可能没有保留任何变体）
+    fingerprint = db.Column(db.String(32), nullable=True)  # 抽样指纹，见 app.vendors.fingerprint
+    # 后台巡检结果，见 app.services.integrity_scrubber；NULL 表示尚未巡检
+    integrity = db.Column(db.String(16), nullable=True)
+    verified_at = db.Column(db.DateTime, nullable=True, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    # 秒传预检先按 (size, fingerprint) 排除不可能重复的文件
+    __table_args__ = (db.Index("ix_blob_size_fingerprint", "size", "fingerprint"),)
 
 class ResumableUpload(db.Model):
     __tablename__ = "uploads"
@@ -31,6 +76,12 @@ class ResumableUpload(db.Model):
     filename = db.Column(db.String(512), nullable=False)
     expected_size = db.Column(db.BigInteger, nullable=True)
     expected_sha256 = db.Column(db.String(64), nullable=True)
+    chunk_size = db.Column(db.Integer, nullable=False)  # 分片 i 写入偏移 i * chunk_size
+    received_bitmap = db.Column(db.LargeBinary, nullable=True)  # 已接收分片位图，见 app.vendors.chunk_bitmap
+    merkle_root = db.Column(db.String(64), nullable=True)  # 提交时由各分片 sha256 计算，见 app.vendors.hashing
+    # 已确认分片的计数与字节数，随位图在同一行锁内更新，查询进度无需扫描分片表
+    received_count = db.Column(db.Integer, default=0, nullable=False)
+    received_bytes = db.Column(db.BigInteger, default=0, nullable=False)
     temp_path = db.Column(db.Text, nullable=False)
     status = db.Column(db.String(16), default=UploadStatusEnum.initiated, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -51,3 +102,39 @@ class UploadChunk(db.Model):
     __table_args__ = (UniqueConstraint("upload_id", "index", name="uq_upload_chunk"),)
 
     # 可选：__repr__ 便于调试
+
+class CommitJob(db.Model):
+    """异步提交任务：请求只入队返回 202，由 app.services.commit_jobs 的工作线程执行，进程重启后继续"""
+    __tablename__ = "commit_jobs"
+    id = db.Column(db.String(36), primary_key=True)  # uuid4
+    upload_id = db.Column(db.String(36), nullable=False, index=True)
+    params = db.Column(db.Text, nullable=True)  # JSON：expected_size / expected_sha256 / expected_merkle_root / content_type / note
+    status = db.Column(db.String(16), default=CommitJobStatusEnum.queued, nullable=False)
+    device = db.Column(db.BigInteger, default=0, nullable=False)  # 临时文件所在设备 st_dev，按盘限制并发
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    lease_token = db.Column(db.String(32), nullable=True)  # 认领时生成，执行者凭它续约与落最终状态
+    file_id = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (db.Index("ix_commit_job_status_created", "status", "created_at"),)
+
+class CdcChunk(db.Model):
+    """内容定义分块，按 sha256 寻址并由多个 Blob 共享；refcount 为引用它的 BlobChunk 行数"""
+    __tablename__ = "cdc_chunks"
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    storage_path = db.Column(db.Text, nullable=False)
+    refcount = db.Column(db.Integer, default=0, nullable=False)  # 客户端刚上传、尚未被提交引用时为 0
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (db.Index("ix_cdc_chunk_refcount", "refcount", "created_at"),)
+
+class BlobChunk(db.Model):
+    """分块存储 Blob 的清单：按 seq 顺序拼接各分块即为完整内容"""
+    __tablename__ = "blob_chunks"
+    blob_sha256 = db.Column(db.String(64), primary_key=True)
+    seq = db.Column(db.Integer, primary_key=True)
+    chunk_sha256 = db.Column(db.String(64), nullable=False, index=True)
+    size = db.Column(db.Integer, nullable=False)
@@ -0,0 +1,73 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from flask_sqlalchemy.session import Session
+
+from app.vendors.settings import Settings
+
+# 读写分离：config.load_config 把 DATABASE_REPLICA_URLS 注册为 replica-N 绑定。
+# 只有包在 read_only() 里的查询才可能走从库，其余一律主库；read_only() 内的写语句、
+# SELECT ... FOR UPDATE 与 flush 仍走主库。没有配置从库或从库都不可用时回落主库。
+# 从库连接出错（断线、连不上）后 DB_REPLICA_RETRY 秒内不再选它；路由层一般用 read_replica / replica_first，
+# 出错或因复制延迟查不到时当场回主库重试。只用于列表、计数这类容忍滞后的查询：
+# 会写进进程内缓存的读（如 FileService 的下载元数据）必须走主库，否则删除后滞后行会被重新缓存。
+REPLICA_PREFIX = "replica-"
+
+_use_replica: ContextVar[bool] = ContextVar("use_replica", default=False)
+_down_until: dict = {}  # Engine -> 恢复可用的 monotonic 时间
+
+@contextmanager
+def read_only():
+    """只读查询允许走从库；可作上下文管理器或装饰器（@read_only()）。从库可能有复制延迟"""
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+def read_replica(fn, *args, **kwargs):
+    """在 read_only() 里执行只读函数；从库出错（handle_error 已把它标记暂停）时回滚会话，改在主库上重试"""
+    try:
+        with read_only():
+            return fn(*args, **kwargs)
+    except OperationalError:
+        from app.models import db
+        db.session.rollback()
+        return fn(*args, **kwargs)
+
+def replica_first(lookup, *args, **kwargs):
+    """按主键/唯一键查单个对象：从库因复制延迟查不到（返回 None）时回主库再查一次"""
+    found = read_replica(lookup, *args, **kwargs)
+    return found if found is not None else lookup(*args, **kwargs)
+
+@event.listens_for(Engine, "handle_error")
+def _on_engine_error(context) -> None:
+    if context.is_disconnect or context.connection is None:
+        _down_until[context.engine] = time.monotonic() + Settings.DB_REPLICA_RETRY
+
+def _is_write(clause) -> bool:
+    if isinstance(clause, sa.sql.dml.UpdateBase):
+        return True
+    return getattr(clause, "_for_update_arg", None) is not None
+
+class RoutingSession(Session):
+    def _replica(self):
+        now = time.monotonic()
+        candidates = [
+            engine for key, engine in self._db.engines.items()
+            if key and key.startswith(REPLICA_PREFIX) and _down_until.get(engine, 0) <= now
+        ]
+        return random.choice(candidates) if candidates else None
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _use_replica.get() and not self._flushing and not _is_write(clause):
+            engine = self._replica()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -1,23 +1,88 @@
-from marshmallow import Schema, fields, validate, ValidationError
+from marshmallow import Schema, fields, validate, validates_schema, ValidationError
+from app.vendors.settings import Settings
 
 class UploadInitSchema(Schema):
     filename = fields.Str(required=True, validate=validate.Length(min=1))
-    expected_size = fields.Integer(required=False)
+    expected_size = fields.Integer(required=False, validate=validate.Range(min=0))
     expected_sha256 = fields.Str(required=False)
+    chunk_size = fields.Integer(required=False, validate=validate.Range(min=Settings.MIN_CHUNK_SIZE, max=Settings.MAX_CHUNK_SIZE))
+    content_type = fields.Str(required=False)
+    note = fields.Str(required=False)
+
+class UploadPrecheckSchema(Schema):
+    size = fields.Integer(required=True, validate=validate.Range(min=0))
+    sha256 = fields.Str(required=False, validate=validate.Length(equal=64))
+    fingerprint = fields.Str(required=False, validate=validate.Length(equal=32))  # 见 app.vendors.fingerprint
+
+    @validates_schema
+    def require_digest(self, data, **kwargs):
+        if not data.get("sha256") and not data.get("fingerprint"):
+            raise ValidationError("sha256 与 fingerprint 至少提供一个", "sha256")
 
 class UploadCommitSchema(Schema):
-    expected_size = fields.Integer(required=False)
+    expected_size = fields.Integer(required=False, validate=validate.Range(min=0))
     expected_sha256 = fields.Str(required=False)
+    expected_merkle_root = fields.Str(required=False)
+    content_type = fields.Str(required=False)
+    note = fields.Str(required=False)
+
+class UploadCommitItemSchema(UploadCommitSchema):
+    upload_id = fields.Str(required=True, validate=validate.Length(equal=36))
+
+class UploadBatchInitSchema(Schema):
+    items = fields.List(fields.Nested(UploadInitSchema), required=True, validate=validate.Length(min=1, max=Settings.BATCH_MAX_ITEMS))
+
+class UploadBatchCommitSchema(Schema):
+    items = fields.List(fields.Nested(UploadCommitItemSchema), required=True, validate=validate.Length(min=1, max=Settings.BATCH_MAX_ITEMS))
+
+    @validates_schema
+    def unique_upload_ids(self, data, **kwargs):
+        ids = [item["upload_id"] for item in data.get("items", [])]
+        if len(ids) != len(set(ids)):
+            raise ValidationError("同一批次中 upload_id 不能重复", "items")
+
+class FileBulkDeleteSchema(Schema):
+    ids = fields.List(fields.Integer(strict=True), required=True, validate=validate.Length(min=1, max=Settings.BATCH_MAX_ITEMS))
+
+class FileArchiveSchema(Schema):
+    # ids 与过滤条件二选一；过滤时按 id 顺序最多取 ARCHIVE_MAX_FILES 个
+    ids = fields.List(fields.Integer(strict=True), required=False, validate=validate.Length(min=1, max=Settings.ARCHIVE_MAX_FILES))
+    since = fields.DateTime(required=False)
+    until = fields.DateTime(required=False)
+    content_type = fields.Str(required=False)  # 前缀匹配，如 "image/"
+    name = fields.Str(required=False)  # 下载文件名，默认 files.zip
+
+    @validates_schema
+    def require_selection(self, data, **kwargs):
+        if not data.get("ids") and not any(data.get(k) for k in ("since", "until", "content_type")):
+            raise ValidationError("ids 与 since/until/content_type 至少提供一个", "ids")
+
+_SHA256 = validate.Regexp(r"^[0-9a-fA-F]{64}$", error="需为 64 位十六进制 sha256")
+
+class CdcMissingSchema(Schema):
+    chunks = fields.List(fields.Str(validate=_SHA256), required=True, validate=validate.Length(min=1, max=Settings.CDC_COMMIT_MAX_CHUNKS))
+
+class CdcCommitSchema(Schema):
+    # chunks 为按文件顺序排列的分块 sha256，可重复；sha256 为整文件 sha256
+    filename = fields.Str(required=True, validate=validate.Length(min=1))
+    chunks = fields.List(fields.Str(validate=_SHA256), required=True, validate=validate.Length(min=1, max=Settings.CDC_COMMIT_MAX_CHUNKS))
+    sha256 = fields.Str(required=True, validate=_SHA256)
     content_type = fields.Str(required=False)
     note = fields.Str(required=False)
 
+def _flatten_messages(messages, prefix=""):
+    # 批量接口的嵌套错误形如 {"items": {0: {"filename": [...]}}}，展开成 items.0.filename
+    for field, value in messages.items():
+        name = f"{prefix}.{field}" if prefix else str(field)
+        if isinstance(value, dict):
+            yield from _flatten_messages(value, name)
+        else:
+            for msg in value:
+                yield f"{name}: {msg}"
+
 def load_and_validate(schema: Schema, json_data: dict):
     try:
         return schema.load(json_data or {})
     except ValidationError as err:
-        all_msgs = []
-        for field, messages in err.messages.items():
-            for msg in messages:
-                all_msgs.append(f"{field}: {msg}")
-        msg = "；".join(all_msgs)
+        msg = "；".join(_flatten_messages(err.messages))
         raise ValueError(f"参数校验失败：{msg}")
@@ -0,0 +1,42 @@
+import logging
+import threading
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+class PeriodicWorker:
+    """在守护线程里按固定间隔执行 fn，每次都在 app context 中运行，异常只记日志不退出"""
+
+    def __init__(self, app, name: str, interval: float, fn: Callable[[], object]) -> None:
+        self.app = app
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self._stop = threading.Event()
+        self._thread: threading.Thread = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    self.fn()
+                except Exception:
+                    logger.exception("后台任务 %s 执行失败", self.name)
+                finally:
+                    from app.models import db
+                    db.session.remove()
+
+_workers: List[PeriodicWorker] = []
+
+def start_worker(app, name: str, interval: float, fn: Callable[[], object]) -> PeriodicWorker:
+    worker = PeriodicWorker(app, name, interval, fn)
+    worker.start()
+    _workers.append(worker)
+    return worker
@@ -0,0 +1,103 @@
+import logging
+import time
+from pathlib import Path
+
+from app.models import db
+from app.models.file import Blob, FileEntry
+from app.vendors.blob_store import blob_path, copy_blob
+from app.vendors.precompress import ENCODING_SUFFIXES, variant_path
+from app.vendors.settings import Settings
+from app.vendors.throttle import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+class BlobRebalancer:
+    """
+    增删 STORAGE_ROOTS 后把 Blob 迁到 pick_root 算出的新位置：
+    逐个在行锁内复制文件（含预压缩变体）并改写 storage_path，整批提交后
+    等过元数据缓存 TTL（各进程缓存里的旧路径都已过期）再删除旧文件。打包存储的小对象与分块存储的内容不参与。
+    """
+
+    def _move_one(self, sha256_hex: str, limiter: RateLimiter, report: dict):
+        blob = (
+            Blob.query.filter_by(sha256=sha256_hex)
+            .with_for_update()
+            .populate_existing()
+            .first()
+        )
+        # 提前返回时都要结束事务，释放 FOR UPDATE 行锁，不让它一直挂到下一个 Blob
+        if blob is None or blob.pack_offset is not None or blob.chunked:
+            db.session.rollback()
+            return None
+        old, new = Path(blob.storage_path), blob_path(blob.sha256)
+        if old == new:
+            db.session.rollback()
+            return None
+        if not old.exists():
+            db.session.rollback()
+            report["missing"] += 1
+            return None
+
+        copy_blob(old, new)
+        limiter.consume(blob.size)
+        moved = [old]
+        for encoding in ENCODING_SUFFIXES:
+            src = variant_path(old, encoding)
+            if src.exists():
+                copy_blob(src, variant_path(new, encoding))
+                moved.append(src)
+
+        FileEntry.query.filter_by(sha256=blob.sha256, storage_path=blob.storage_path).update(
+            {FileEntry.storage_path: str(new)}, synchronize_session=False
+        )
+        blob.storage_path = str(new)
+        db.session.commit()
+        report["moved"] += 1
+        report["bytes"] += blob.size
+        return moved
+
+    def run(self, dry_run: bool = False, limit: int = None) -> dict:
+        started = time.monotonic()
+        limiter = RateLimiter(Settings.REAPER_IO_BYTES_PER_SEC)
+        report = {"scanned": 0, "misplaced": 0, "moved": 0, "missing": 0, "bytes": 0}
+        last_sha = ""
+        while limit is None or report["misplaced"] < limit:
+            rows = (
+                db.session.query(Blob.sha256, Blob.storage_path)
+                .filter(Blob.sha256 > last_sha, Blob.pack_offset.is_(None), Blob.chunked.is_(False))
+                .order_by(Blob.sha256)
+                .limit(Settings.RECLAIM_BATCH_SIZE)
+                .all()
+            )
+            db.session.commit()
+            if not rows:
+                break
+            last_sha = rows[-1].sha256
+            report["scanned"] += len(rows)
+
+            stale = []
+            for row in rows:
+                if Path(row.storage_path) == blob_path(row.sha256):
+                    continue
+                if limit is not None and report["misplaced"] >= limit:
+                    break
+                report["misplaced"] += 1
+                if dry_run:
+                    continue
+                try:
+                    moved = self._move_one(row.sha256, limiter, report)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception("Blob %s 迁移失败", row.sha256)
+                    continue
+                if moved:
+                    stale.extend(moved)
+
+            if stale:
+                time.sleep(Settings.META_CACHE_TTL)
+                for path in stale:
+                    path.unlink(missing_ok=True)
+
+        report["seconds"] = round(time.monotonic() - started, 3)
+        logger.info("存储根目录重平衡完成: %s", report)
+        return report
@@ -0,0 +1,133 @@
+import logging
+import time
+from collections import Counter
+from pathlib import Path
+
+from app.models import db
+from app.models.file import Blob, FileEntry, FileStatusEnum
+from app.services import chunk_store
+from app.vendors.precompress import ENCODING_SUFFIXES, variant_path
+from app.vendors.settings import Settings
+from app.vendors.throttle import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+class BlobReclaimer:
+    """
+    已删除文件的物理回收：分批释放 deleted 条目对 Blob 的引用，
+    refcount 归零的 Blob 在行锁内删行、删文件（含预压缩变体；分块存储则释放分块引用），再清掉对应派生图。
+    最后清理客户端上传后超期仍未被引用的分块。
+    与上传并发时由 Blob 行锁串行化：上传先 +1 则这里看到 refcount > 0 跳过；这里先删则上传重新建行。
+    """
+
+    def __init__(self, file_service=None) -> None:
+        self.file_service = file_service
+        self.last_report: dict = {}
+
+    def _unlink(self, path: Path, limiter: RateLimiter, report: dict) -> None:
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except FileNotFoundError:
+            return
+        report["files"] += 1
+        report["bytes"] += size
+        limiter.consume(max(size, 64 * 1024))
+
+    def _release_blob(self, sha256_hex: str, limiter: RateLimiter, report: dict) -> bool:
+        blob = (
+            Blob.query.filter_by(sha256=sha256_hex)
+            .with_for_update()
+            .populate_existing()
+            .first()
+        )
+        if blob is None or blob.refcount > 0:
+            return False
+        path, packed, chunked = Path(blob.storage_path), blob.pack_offset is not None, blob.chunked
+        db.session.delete(blob)
+        db.session.flush()
+        report["blobs"] += 1
+        if chunked:
+            # 分块存储只释放分块引用，归零的分块在各自的行锁内删除
+            chunks = chunk_store.release_manifest(sha256_hex)
+            for chunk in chunks:
+                self._unlink(chunk, limiter, report)
+            report["chunks"] += len(chunks)
+            return True
+        if packed:
+            # 包内对象只删行，空间由 compact-packs 回收
+            return True
+        # 行锁持有到提交：期间同内容的上传会等待，不会在文件删掉后又引用旧行
+        self._unlink(path, limiter, report)
+        for encoding in ENCODING_SUFFIXES:
+            self._unlink(variant_path(path, encoding), limiter, report)
+        return True
+
+    def _release_legacy(self, storage_path: str, limiter: RateLimiter, report: dict) -> None:
+        # 内容寻址之前的平铺文件没有 Blob 行，没有任何有效条目再引用时才删
+        still_used = (
+            db.session.query(FileEntry.id)
+            .filter(FileEntry.storage_path == storage_path, FileEntry.status == FileStatusEnum.active)
+            .first()
+        )
+        if still_used is None:
+            self._unlink(Path(storage_path), limiter, report)
+
+    def run_once(self) -> dict:
+        started = time.monotonic()
+        limiter = RateLimiter(Settings.REAPER_IO_BYTES_PER_SEC)
+        report = {"entries": 0, "blobs": 0, "chunks": 0, "files": 0, "bytes": 0}
+        while True:
+            rows = (
+                FileEntry.query
+                .filter(FileEntry.status == FileStatusEnum.deleted, FileEntry.reclaimed.is_(False))
+                .order_by(FileEntry.id)
+                .limit(Settings.RECLAIM_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            if not rows:
+                db.session.commit()
+                break
+
+            refs = Counter(r.sha256 for r in rows)
+            legacy = set()
+            for r in rows:
+                r.reclaimed = True
+            # 按 sha256 顺序加锁，避免与并发上传互相死锁
+            for sha256_hex, n in sorted(refs.items()):
+                updated = (
+                    Blob.query.filter_by(sha256=sha256_hex)
+                    .update({Blob.refcount: Blob.refcount - n}, synchronize_session=False)
+                )
+                if not updated:
+                    legacy.add(sha256_hex)
+            released = [
+                sha256_hex for sha256_hex in sorted(refs)
+                if sha256_hex not in legacy and self._release_blob(sha256_hex, limiter, report)
+            ]
+            for storage_path in sorted({r.storage_path for r in rows if r.sha256 in legacy}):
+                self._release_legacy(storage_path, limiter, report)
+            db.session.commit()
+
+            report["entries"] += len(rows)
+            if self.file_service is not None:
+                for sha256_hex in released:
+                    self.file_service.purge_derivatives(sha256_hex)
+            time.sleep(Settings.REAPER_BATCH_PAUSE)
+
+        # 客户端上传后一直未被提交引用的分块
+        while True:
+            paths = chunk_store.unreferenced_chunks(Settings.RECLAIM_BATCH_SIZE)
+            for path in paths:
+                self._unlink(path, limiter, report)
+            db.session.commit()
+            report["chunks"] += len(paths)
+            if len(paths) < Settings.RECLAIM_BATCH_SIZE:
+                break
+            time.sleep(Settings.REAPER_BATCH_PAUSE)
+
+        report["seconds"] = round(time.monotonic() - started, 3)
+        self.last_report = report
+        logger.info("删除文件回收完成: %s", report)
+        return report
@@ -0,0 +1,129 @@
+import hashlib
+import logging
+import time
+from pathlib import Path
+
+from sqlalchemy import or_
+
+from app.models import db
+from app.models.file import Blob, FileEntry, IntegrityEnum
+from app.services import chunk_store
+from app.vendors import cdc
+from app.vendors.precompress import ENCODING_SUFFIXES, variant_path
+from app.vendors.settings import Settings
+from app.vendors.throttle import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+class CdcChunker:
+    """
+    把不小于 CDC_MIN_FILE_SIZE 的整文件 Blob 转为分块存储：先不持锁读一遍算出分块与整体 sha256
+    （与记录不符的跳过，交给巡检），再在 Blob 行锁内写入新分块、登记清单并改写 storage_path。
+    同一文件的多个版本转换后共享未变化的分块，只有变化的部分占空间。
+    整批提交后等过元数据缓存 TTL 再删除原文件（含预压缩变体），与 BlobRebalancer 一致。
+    """
+
+    def __init__(self) -> None:
+        self.last_report: dict = {}
+
+    def _split(self, path: Path, limiter: RateLimiter):
+        h, chunks = hashlib.sha256(), []
+        for offset, data in cdc.iter_chunks(path):
+            h.update(data)
+            chunks.append((hashlib.sha256(data).hexdigest(), offset, len(data)))
+            limiter.consume(len(data))
+        return h.hexdigest(), chunks
+
+    def _convert(self, sha256_hex: str, storage_path: str, limiter: RateLimiter, report: dict):
+        path = Path(storage_path)
+        try:
+            digest, chunks = self._split(path, limiter)
+        except FileNotFoundError:
+            report["missing"] += 1
+            return None
+        if digest != sha256_hex:
+            report["mismatch"] += 1
+            return None
+
+        blob = (
+            Blob.query.filter_by(sha256=sha256_hex)
+            .with_for_update()
+            .populate_existing()
+            .first()
+        )
+        if blob is None or blob.chunked or blob.storage_path != storage_path:
+            db.session.commit()
+            return None
+
+        with path.open("rb") as f:
+            def reader(offset, length):
+                def read():
+                    f.seek(offset)
+                    return f.read(length)
+                return read
+
+            # 按 sha256 顺序加引用，与客户端提交、回收时的加锁顺序一致
+            for chunk_sha, offset, length in sorted(chunks):
+                if chunk_store.acquire_chunk(chunk_sha, length, reader(offset, length)):
+                    report["new_bytes"] += length
+                else:
+                    report["shared_bytes"] += length
+        chunk_store.add_manifest(sha256_hex, [(chunk_sha, length) for chunk_sha, _, length in chunks])
+
+        blob.chunked, blob.encodings = True, None
+        blob.storage_path = f"cdc:{sha256_hex}"
+        FileEntry.query.filter_by(sha256=sha256_hex, storage_path=storage_path).update(
+            {FileEntry.storage_path: blob.storage_path}, synchronize_session=False
+        )
+        db.session.commit()
+        report["converted"] += 1
+        report["chunks"] += len(chunks)
+        return [path] + [variant_path(path, encoding) for encoding in ENCODING_SUFFIXES]
+
+    def run_once(self) -> dict:
+        started = time.monotonic()
+        limiter = RateLimiter(Settings.SCRUB_IO_BYTES_PER_SEC)
+        report = {"scanned": 0, "converted": 0, "chunks": 0, "new_bytes": 0, "shared_bytes": 0, "missing": 0, "mismatch": 0}
+        last_sha = ""
+        while True:
+            rows = (
+                db.session.query(Blob.sha256, Blob.storage_path)
+                .filter(
+                    Blob.sha256 > last_sha,
+                    Blob.chunked.is_(False),
+                    Blob.pack_offset.is_(None),
+                    Blob.size >= Settings.CDC_MIN_FILE_SIZE,
+                    Blob.refcount > 0,
+                    or_(Blob.integrity.is_(None), Blob.integrity == IntegrityEnum.ok),
+                )
+                .order_by(Blob.sha256)
+                .limit(Settings.CDC_BATCH_SIZE)
+                .all()
+            )
+            # 切分读盘期间不持有事务
+            db.session.commit()
+            if not rows:
+                break
+            last_sha = rows[-1].sha256
+            report["scanned"] += len(rows)
+
+            stale = []
+            for row in rows:
+                try:
+                    moved = self._convert(row.sha256, row.storage_path, limiter, report)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception("Blob %s 转为分块存储失败", row.sha256)
+                    continue
+                if moved:
+                    stale.extend(moved)
+
+            if stale:
+                time.sleep(Settings.META_CACHE_TTL)
+                for path in stale:
+                    path.unlink(missing_ok=True)
+
+        report["seconds"] = round(time.monotonic() - started, 3)
+        self.last_report = report
+        logger.info("分块去重转换完成: %s", report)
+        return report
@@ -0,0 +1,194 @@
+import hashlib
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Iterable, List, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db
+from app.models.file import BlobChunk, CdcChunk
+from app.vendors import cdc
+from app.vendors.blob_store import place_blob
+from app.vendors.buffer_pool import pool, readinto
+from app.vendors.settings import Settings
+
+# 分块存储的引用计数，与 Blob 同样的规则：先 UPDATE refcount+1，没有行再在保存点里插入，
+# 冲突说明并发写入了同一分块，回到 +1 分支；归零的分块在行锁内删行删文件。
+# 多个分块一起加减时按 sha256 顺序加锁，避免互相死锁。以下函数都不提交，由调用方 commit。
+
+def acquire_chunk(sha256_hex: str, size: int, read: Callable[[], bytes]) -> bool:
+    """分块 refcount +1，不存在时写入 read() 的数据；返回是否新写入"""
+    while True:
+        updated = (
+            CdcChunk.query.filter_by(sha256=sha256_hex)
+            .update({CdcChunk.refcount: CdcChunk.refcount + 1}, synchronize_session=False)
+        )
+        if updated:
+            path = Path(CdcChunk.query.get(sha256_hex).storage_path)
+            if not path.exists():
+                cdc.write_chunk(read(), path)
+                return True
+            return False
+
+        path = cdc.chunk_path(sha256_hex)
+        cdc.write_chunk(read(), path)
+        try:
+            with db.session.begin_nested():
+                db.session.add(CdcChunk(
+                    sha256=sha256_hex, size=size, storage_path=str(path), refcount=1, created_at=datetime.utcnow(),
+                ))
+        except IntegrityError:
+            continue
+        return True
+
+def add_refs(chunk_hashes: Iterable[str]) -> None:
+    """客户端提交的分块清单：每个分块按出现次数 +1，有缺失的分块时抛 ValueError"""
+    missing = []
+    for sha256_hex, n in sorted(Counter(chunk_hashes).items()):
+        updated = (
+            CdcChunk.query.filter_by(sha256=sha256_hex)
+            .update({CdcChunk.refcount: CdcChunk.refcount + n}, synchronize_session=False)
+        )
+        if not updated:
+            missing.append(sha256_hex)
+    if missing:
+        raise ValueError(f"分块缺失: {', '.join(missing[:10])}")
+
+def missing_chunks(chunk_hashes: List[str]) -> List[str]:
+    """
+    返回服务端没有的分块（保持请求中的顺序、去重）。
+    已有但暂未被引用的分块顺带重新计时，客户端据此跳过上传后不会在提交前被清理。
+    """
+    wanted = list(dict.fromkeys(h.lower() for h in chunk_hashes))
+    present = set()
+    for i in range(0, len(wanted), 500):
+        batch = wanted[i:i + 500]
+        present.update(r.sha256 for r in db.session.query(CdcChunk.sha256).filter(CdcChunk.sha256.in_(batch)))
+        CdcChunk.query.filter(CdcChunk.sha256.in_(batch), CdcChunk.refcount <= 0).update(
+            {CdcChunk.created_at: datetime.utcnow()}, synchronize_session=False
+        )
+    return [h for h in wanted if h not in present]
+
+def store_uploaded_chunk(sha256_hex: str, stream) -> dict:
+    """
+    客户端上传的单个分块：校验 sha256 后入库，refcount 为 0，
+    等待提交时引用；超过 UPLOAD_SESSION_TTL 仍未被引用的由 BlobReclaimer 清理。
+    """
+    sha256_hex = sha256_hex.lower()
+    tmp = Settings.TMP_DIR / f"chunk-{uuid.uuid4().hex}.part"
+    h, size = hashlib.sha256(), 0
+    try:
+        with tmp.open("wb") as f, pool.buffer() as buf:
+            while True:
+                n = readinto(stream, buf)
+                if not n:
+                    break
+                size += n
+                if size > Settings.CDC_UPLOAD_MAX_CHUNK:
+                    raise ValueError(f"分块超过 {Settings.CDC_UPLOAD_MAX_CHUNK} 字节")
+                h.update(buf[:n])
+                f.write(buf[:n])
+        if size == 0:
+            raise ValueError("分块为空")
+        if h.hexdigest() != sha256_hex:
+            raise ValueError("分块 sha256 不匹配")
+
+        chunk = CdcChunk.query.get(sha256_hex)
+        if chunk is None:
+            path = cdc.chunk_path(sha256_hex)
+            place_blob(tmp, path)
+            try:
+                with db.session.begin_nested():
+                    db.session.add(CdcChunk(
+                        sha256=sha256_hex, size=size, storage_path=str(path), refcount=0, created_at=datetime.utcnow(),
+                    ))
+            except IntegrityError:
+                pass
+        else:
+            if not Path(chunk.storage_path).exists():
+                place_blob(tmp, Path(chunk.storage_path))
+            # 重新计时，避免刚确认存在的未引用分块在提交前被清理
+            chunk.created_at = datetime.utcnow()
+        db.session.commit()
+        return {"sha256": sha256_hex, "size": size}
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        tmp.unlink(missing_ok=True)
+
+def chunk_rows(chunk_hashes: Iterable[str]) -> dict:
+    """sha256 -> (分块路径, 大小)，只含已存在的分块"""
+    found = {}
+    wanted = sorted(set(chunk_hashes))
+    for i in range(0, len(wanted), 500):
+        for r in db.session.query(CdcChunk.sha256, CdcChunk.size, CdcChunk.storage_path).filter(
+            CdcChunk.sha256.in_(wanted[i:i + 500])
+        ):
+            found[r.sha256] = (r.storage_path, r.size)
+    return found
+
+def manifest_segments(blob_sha256: str) -> Tuple[cdc.Segment, ...]:
+    rows = (
+        db.session.query(CdcChunk.storage_path, BlobChunk.size)
+        .join(CdcChunk, CdcChunk.sha256 == BlobChunk.chunk_sha256)
+        .filter(BlobChunk.blob_sha256 == blob_sha256)
+        .order_by(BlobChunk.seq)
+        .all()
+    )
+    return tuple((r.storage_path, r.size) for r in rows)
+
+def add_manifest(blob_sha256: str, chunks: List[Tuple[str, int]]) -> None:
+    db.session.bulk_save_objects([
+        BlobChunk(blob_sha256=blob_sha256, seq=i, chunk_sha256=sha256_hex, size=size)
+        for i, (sha256_hex, size) in enumerate(chunks)
+    ])
+
+def _grace_cutoff() -> datetime:
+    # 未引用的分块至少保留 UPLOAD_SESSION_TTL：客户端可能刚上传或刚确认存在、还没来得及提交
+    return datetime.utcnow() - timedelta(seconds=Settings.UPLOAD_SESSION_TTL)
+
+def _drop_unreferenced(chunk_hashes: Iterable[str]) -> List[Path]:
+    cutoff, paths = _grace_cutoff(), []
+    for sha256_hex in sorted(set(chunk_hashes)):
+        chunk = (
+            CdcChunk.query.filter_by(sha256=sha256_hex)
+            .with_for_update()
+            .populate_existing()
+            .first()
+        )
+        if chunk is None or chunk.refcount > 0 or chunk.created_at >= cutoff:
+            continue
+        paths.append(Path(chunk.storage_path))
+        db.session.delete(chunk)
+    db.session.flush()
+    return paths
+
+def release_manifest(blob_sha256: str) -> List[Path]:
+    """
+    删除 Blob 的分块清单并释放引用；返回归零后删掉行的分块文件，由调用方在提交前删除。
+    近期上传或确认过的分块即使归零也暂时保留，之后由 unreferenced_chunks 清理。
+    """
+    rows = BlobChunk.query.filter_by(blob_sha256=blob_sha256).all()
+    if not rows:
+        return []
+    refs = Counter(r.chunk_sha256 for r in rows)
+    BlobChunk.query.filter_by(blob_sha256=blob_sha256).delete(synchronize_session=False)
+    for sha256_hex, n in sorted(refs.items()):
+        CdcChunk.query.filter_by(sha256=sha256_hex).update(
+            {CdcChunk.refcount: CdcChunk.refcount - n}, synchronize_session=False
+        )
+    return _drop_unreferenced(refs)
+
+def unreferenced_chunks(limit: int) -> List[Path]:
+    """超过保留期仍未被任何 Blob 引用的分块：删行并返回文件路径，由调用方在提交前删除"""
+    rows = (
+        db.session.query(CdcChunk.sha256)
+        .filter(CdcChunk.refcount <= 0, CdcChunk.created_at < _grace_cutoff())
+        .order_by(CdcChunk.refcount, CdcChunk.created_at)
+        .limit(limit)
+        .all()
+    )
+    return _drop_unreferenced(r.sha256 for r in rows)
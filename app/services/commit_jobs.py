@@ -0,0 +1,192 @@
+import logging
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from app.models import db
+from app.models.file import CommitJob, CommitJobStatusEnum
+from app.services.background import PeriodicWorker
+from app.vendors.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+class CommitJobRunner:
+    """
+    异步提交的进程内工作池：任务持久化在 commit_jobs 表，工作线程按创建顺序认领
+    （UPDATE ... WHERE status='queued' 抢占，多进程安全），同一块盘（临时文件 st_dev）
+    上同时执行的任务不超过 COMMIT_PER_DISK。认领时写入租约令牌，执行期间每 COMMIT_JOB_LEASE/4
+    秒续约一次（刷新 updated_at）；超过 COMMIT_JOB_LEASE 未续约的任务视为所在进程已退出，重新排队，
+    超过 COMMIT_JOB_MAX_ATTEMPTS 次则置为失败。任务的最终状态只在令牌仍匹配时落库，
+    被重新排队后原执行者的结果作废，不会覆盖接手者。
+    """
+
+    def __init__(self, app, file_service) -> None:
+        self.app = app
+        self.file_service = file_service
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._active = defaultdict(int)  # st_dev -> 本进程执行中的任务数
+        self._leases = {}  # job_id -> 本进程持有的租约令牌
+        self._threads = []
+        self._lease_worker = PeriodicWorker(app, "commit-job-lease", Settings.COMMIT_JOB_LEASE / 4, self._maintain)
+
+    def start(self) -> None:
+        for i in range(Settings.COMMIT_WORKERS):
+            t = threading.Thread(target=self._loop, name=f"commit-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        self._lease_worker.start()
+
+    def join(self) -> None:
+        for t in self._threads:
+            t.join()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        self._lease_worker.stop()
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    def renew_leases(self) -> int:
+        """
+        为本进程执行中的任务续约，返回续约条数；令牌已不匹配的说明任务被重新排队，不再续约。
+        正在合并的任务行被执行者锁住（SKIP LOCKED 跳过），锁住期间回收也会跳过它，无需续约。
+        """
+        with self._lock:
+            held = dict(self._leases)
+        if not held:
+            return 0
+        rows = (
+            db.session.query(CommitJob.id, CommitJob.lease_token)
+            .filter(CommitJob.id.in_(list(held)), CommitJob.status == CommitJobStatusEnum.running)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        live = [r.id for r in rows if r.lease_token == held[r.id]]
+        if live:
+            CommitJob.query.filter(CommitJob.id.in_(live)).update(
+                {CommitJob.updated_at: datetime.utcnow()}, synchronize_session=False
+            )
+        db.session.commit()
+        return len(live)
+
+    def _maintain(self) -> None:
+        # 先续约再回收，本进程正在执行的任务不会被自己判为过期
+        self.renew_leases()
+        self.recover_stale()
+
+    def recover_stale(self) -> int:
+        """把租约过期（超过 COMMIT_JOB_LEASE 未续约）的 running 任务放回队列（或置为失败），返回处理条数"""
+        cutoff = datetime.utcnow() - timedelta(seconds=Settings.COMMIT_JOB_LEASE)
+        stale_ids = [
+            r.id for r in db.session.query(CommitJob.id)
+            .filter(CommitJob.status == CommitJobStatusEnum.running, CommitJob.updated_at < cutoff)
+            .with_for_update(skip_locked=True)
+            .limit(500)
+        ]
+        if not stale_ids:
+            db.session.commit()
+            return 0
+        stale = CommitJob.id.in_(stale_ids)
+        now = datetime.utcnow()
+        failed = CommitJob.query.filter(stale, CommitJob.attempts >= Settings.COMMIT_JOB_MAX_ATTEMPTS).update(
+            {
+                CommitJob.status: CommitJobStatusEnum.failed,
+                CommitJob.error: "执行超时或进程退出次数过多",
+                CommitJob.lease_token: None,
+                CommitJob.updated_at: now,
+            },
+            synchronize_session=False,
+        )
+        requeued = CommitJob.query.filter(stale, CommitJob.status == CommitJobStatusEnum.running).update(
+            {CommitJob.status: CommitJobStatusEnum.queued, CommitJob.lease_token: None, CommitJob.updated_at: now},
+            synchronize_session=False,
+        )
+        db.session.commit()
+        if failed or requeued:
+            logger.warning("提交任务恢复：重新排队 %s 个，失败 %s 个", requeued, failed)
+        return failed + requeued
+
+    def _take_slot(self, device: int) -> bool:
+        with self._lock:
+            if self._active[device] >= Settings.COMMIT_PER_DISK:
+                return False
+            self._active[device] += 1
+            return True
+
+    def _release_slot(self, device: int) -> None:
+        with self._lock:
+            self._active[device] -= 1
+        # 释放名额后可能有因同盘满额而跳过的任务可以执行了
+        self._wake.set()
+
+    def _claim(self) -> Optional[Tuple[str, int, str]]:
+        candidates = (
+            db.session.query(CommitJob.id, CommitJob.device)
+            .filter(CommitJob.status == CommitJobStatusEnum.queued)
+            .order_by(CommitJob.created_at)
+            .limit(Settings.COMMIT_WORKERS * 4)
+            .all()
+        )
+        db.session.commit()
+        for job_id, device in candidates:
+            if not self._take_slot(device):
+                continue
+            now, token = datetime.utcnow(), uuid.uuid4().hex
+            claimed = CommitJob.query.filter_by(id=job_id, status=CommitJobStatusEnum.queued).update(
+                {
+                    CommitJob.status: CommitJobStatusEnum.running,
+                    CommitJob.attempts: CommitJob.attempts + 1,
+                    CommitJob.lease_token: token,
+                    CommitJob.updated_at: now,
+                },
+                synchronize_session=False,
+            )
+            db.session.commit()
+            if claimed:
+                with self._lock:
+                    self._leases[job_id] = token
+                return job_id, device, token
+            self._release_slot(device)
+        return None
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            claimed = None
+            with self.app.app_context():
+                try:
+                    claimed = self._claim()
+                    if claimed is not None:
+                        self.file_service.run_commit_job(claimed[0], claimed[2])
+                except Exception:
+                    logger.exception("提交任务执行失败")
+                    db.session.rollback()
+                finally:
+                    if claimed is not None:
+                        with self._lock:
+                            self._leases.pop(claimed[0], None)
+                        self._release_slot(claimed[1])
+                    db.session.remove()
+            if claimed is None:
+                self._wake.wait(Settings.COMMIT_POLL_INTERVAL)
+                self._wake.clear()
+
+runner: Optional[CommitJobRunner] = None
+
+def start_runner(app, file_service) -> CommitJobRunner:
+    global runner
+    runner = CommitJobRunner(app, file_service)
+    with app.app_context():
+        runner.recover_stale()
+    runner.start()
+    return runner
+
+def notify() -> None:
+    """入队后唤醒本进程的工作线程；本进程没有工作池时由其它进程轮询认领"""
+    if runner is not None:
+        runner.notify()
@@ -1,40 +1,236 @@
+import io
+import json
+import os
 import uuid
 from pathlib import Path
-from datetime import datetime
-from typing import Optional
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional, Tuple
 from flask import url_for
 from werkzeug.datastructures import FileStorage
 from flask import current_app
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
 
 from app.models import db
 from app.models.file import (
-    FileEntry, ResumableUpload, UploadChunk,
-    UploadStatusEnum, FileStatusEnum,
+    FileEntry, ResumableUpload, UploadChunk, Blob, PublicNameCounter, CommitJob,
+    UploadStatusEnum, FileStatusEnum, CommitJobStatusEnum, IntegrityEnum,
 )
 from app.vendors.settings import Settings
 from app.vendors.storage import (
-    sanitize_filename, split_name, atomic_move, ensure_parent, sha256_of_path,
+    sanitize_filename, split_name, ensure_parent, sha256_of_path,
+    write_stream_at, copy_into,
 )
+from app.vendors import chunk_bitmap
+from app.vendors.blob_store import blob_path, pick_root, place_blob
+from app.vendors import pack_store
+from app.vendors.buffer_pool import pool as buffer_pool, readinto
+from app.vendors.fingerprint import fingerprint_of_path, fingerprint_of_fileobj
+from app.vendors import cdc
+from app.services import chunk_store
+from app.vendors.zip_stream import ArchiveMember
+from app.vendors.precompress import parse_encodings
+from app.vendors.hashing import HasherRegistry, merkle_root
+from app.vendors.cache import TTLCache
+from app.vendors.image_derivatives import DerivativeCache, DerivativeParams
 import hashlib
 
+@dataclass(frozen=True)
+class FileMeta:
+    """下载/直链所需的文件元数据快照，可脱离数据库会话缓存；全部来自数据库，不访问磁盘"""
+    id: int
+    public_name: str
+    original_name: str
+    storage_path: str
+    size: int
+    sha256: str
+    content_type: Optional[str]
+    status: str
+    created_at: Optional[datetime]
+    encodings: Tuple[Tuple[str, int], ...] = ()  # 预压缩变体 (编码, 大小)
+    pack_offset: Optional[int] = None  # 打包存储时内容在 storage_path 中的偏移
+    integrity: Optional[str] = None  # 最近一次巡检结果，见 IntegrityEnum
+    segments: Tuple[cdc.Segment, ...] = ()  # 分块存储时按序拼接的 (分块路径, 大小)
+
+    @classmethod
+    def from_row(cls, row: FileEntry, blob: Optional[Blob] = None, segments: Tuple[cdc.Segment, ...] = ()) -> "FileMeta":
+        return cls(
+            id=row.id,
+            public_name=row.public_name,
+            original_name=row.original_name,
+            storage_path=row.storage_path,
+            size=row.size,
+            sha256=row.sha256,
+            content_type=row.content_type,
+            status=row.status,
+            created_at=row.created_at,
+            encodings=tuple(parse_encodings(blob.encodings).items()) if blob else (),
+            pack_offset=blob.pack_offset if blob else None,
+            integrity=blob.integrity if blob else None,
+            segments=segments,
+        )
+
+    @property
+    def last_modified(self) -> Optional[datetime]:
+        # 内容按 sha256 寻址后不会原地改写，入库时间即内容的最后修改时间
+        if self.created_at is None:
+            return None
+        return self.created_at.replace(tzinfo=timezone.utc)
+
 class FileService:
     """
     文件上传/分片/查询 的业务逻辑
     """
 
+    def __init__(self) -> None:
+        # 分片会话的增量整文件哈希，进程重启或被淘汰后提交时回退为整文件重读
+        self._hashers = HasherRegistry(Settings.HASHER_REGISTRY_MAX)
+        # 下载/直链热路径的元数据缓存，条目提交、删除时主动失效
+        self._meta_cache = TTLCache(Settings.META_CACHE_SIZE, Settings.META_CACHE_TTL)
+        self._derivatives = DerivativeCache(Settings.DERIVATIVE_DIR, Settings.DERIVATIVE_CACHE_MAX_BYTES)
+
     # ---------- small helpers ----------
-    def _ensure_unique_public_name(self, base_name: str, sha256_val: str) -> str:
-        candidate = base_name
+    def _next_name_suffix(self, base_name: str) -> int:
+        # 计数器行在本事务内被 UPDATE 锁住，同名并发上传依次拿到不同后缀
+        while True:
+            updated = (
+                PublicNameCounter.query.filter_by(base_name=base_name)
+                .update({PublicNameCounter.next_suffix: PublicNameCounter.next_suffix + 1}, synchronize_session=False)
+            )
+            if updated:
+                return db.session.query(PublicNameCounter.next_suffix).filter_by(base_name=base_name).scalar() - 1
+            try:
+                with db.session.begin_nested():
+                    db.session.add(PublicNameCounter(base_name=base_name, next_suffix=2))
+                return 1
+            except IntegrityError:
+                continue
+
+    def _insert_with_public_name(self, entry: FileEntry, base_name: str) -> None:
+        """
+        先按原名插入，撞上 public_name 唯一索引再从计数器取 -N 后缀重试，不逐个探测已占用的名字。
+        计数器之前的旧后缀（计数器上线前分配的）只会在每个名字上撞一次，之后计数器已越过它们。
+        """
         stem, suffix = split_name(base_name)
-        i = 1
+        entry.public_name = base_name
+        while True:
+            try:
+                with db.session.begin_nested():
+                    db.session.add(entry)
+                return
+            except IntegrityError:
+                entry.public_name = f"{stem}-{self._next_name_suffix(base_name)}{suffix}"
+
+    def _store_packed(self, blob: Blob, tmp_path: Path) -> None:
+        with tmp_path.open("rb") as f:
+            pack_path, offset = pack_store.append(pick_root(blob.sha256), f, blob.size)
+        tmp_path.unlink(missing_ok=True)
+        blob.storage_path, blob.pack_offset = str(pack_path), offset
+
+    def _repair_blob(self, blob: Blob, tmp_path: Path) -> None:
+        if blob.chunked:
+            # 分块存储的内容有分块缺失/损坏：改回整文件存储，释放原来的分块
+            path = blob_path(blob.sha256)
+            place_blob(tmp_path, path)
+            for stale in chunk_store.release_manifest(blob.sha256):
+                stale.unlink(missing_ok=True)
+            blob.chunked, blob.storage_path = False, str(path)
+            FileEntry.query.filter_by(sha256=blob.sha256).update(
+                {FileEntry.storage_path: blob.storage_path}, synchronize_session=False
+            )
+        elif blob.pack_offset is not None:
+            self._store_packed(blob, tmp_path)
+            FileEntry.query.filter_by(sha256=blob.sha256).update(
+                {FileEntry.storage_path: blob.storage_path}, synchronize_session=False
+            )
+        else:
+            place_blob(tmp_path, Path(blob.storage_path))
+        blob.integrity, blob.verified_at = IntegrityEnum.ok, datetime.utcnow()
+
+    def _acquire_blob(self, tmp_path: Path, checksum: str, size: int) -> Blob:
+        """
+        把临时文件纳入内容寻址存储并把 refcount +1；内容已存在时丢弃临时文件。
+        小于 PACK_THRESHOLD 的内容在开启打包时追加进包文件，不单独成文件。
+        """
         while True:
-            existing = FileEntry.query.filter_by(public_name=candidate).first()
-            if not existing:
-                return candidate
-            if existing.sha256 == sha256_val:
-                return existing.public_name
-            candidate = f"{stem}-{i}{suffix}"
-            i += 1
+            updated = (
+                Blob.query.filter_by(sha256=checksum)
+                .update({Blob.refcount: Blob.refcount + 1}, synchronize_session=False)
+            )
+            if updated:
+                blob = Blob.query.get(checksum)
+                path = Path(blob.storage_path)
+                if blob.integrity in (IntegrityEnum.missing, IntegrityEnum.corrupt):
+                    # 巡检标记为缺失/损坏的内容，用这次上传的完好副本修复
+                    self._repair_blob(blob, tmp_path)
+                elif blob.chunked or path.exists():
+                    tmp_path.unlink(missing_ok=True)
+                elif blob.pack_offset is not None:
+                    # 包文件丢了：这份内容重新追加到当前包
+                    self._store_packed(blob, tmp_path)
+                    FileEntry.query.filter_by(sha256=checksum).update(
+                        {FileEntry.storage_path: blob.storage_path}, synchronize_session=False
+                    )
+                else:
+                    # 行在但文件丢了：用这次上传的内容补回
+                    place_blob(tmp_path, path)
+                return blob
+
+            blob = Blob(
+                sha256=checksum,
+                size=size,
+                storage_path=str(blob_path(checksum)),
+                refcount=1,
+                fingerprint=fingerprint_of_path(tmp_path, size),
+                created_at=datetime.utcnow(),
+            )
+            try:
+                with db.session.begin_nested():
+                    db.session.add(blob)
+            except IntegrityError:
+                # 并发上传同一内容，对方先插入了行，回到 +1 分支；临时文件还在，修复/补文件分支仍可用它
+                continue
+            if pack_store.should_pack(size):
+                # 插行成功后再追加进包：新行提交前别的事务看不到占位的 storage_path
+                self._store_packed(blob, tmp_path)
+                return blob
+            # 预压缩变体由后台 Precompressor 在提交后补建，不占用本事务与 Blob 行锁
+            place_blob(tmp_path, Path(blob.storage_path))
+            return blob
+
+    def _find_same_entry(self, checksum: str, original_name: str) -> Optional[FileEntry]:
+        # 同名同内容视为重复上传
+        return FileEntry.query.filter_by(
+            sha256=checksum, original_name=original_name, status=FileStatusEnum.active,
+        ).first()
+
+    def _new_entry(self, storage_path: str, checksum: str, size: int, original_name: str, content_type: Optional[str], note: Optional[str]) -> FileEntry:
+        entry = FileEntry(
+            original_name=original_name,
+            content_type=content_type,
+            size=size,
+            sha256=checksum,
+            storage_path=storage_path,
+            note=note,
+            created_at=datetime.utcnow(),
+            status=FileStatusEnum.active,
+        )
+        self._insert_with_public_name(entry, sanitize_filename(original_name))
+        return entry
+
+    def _register_entry(self, tmp_path: Path, checksum: str, size: int, original_name: str, content_type: Optional[str], note: Optional[str]) -> FileEntry:
+        """
+        校验完成后的统一落库：同名同内容直接返回已有条目；
+        否则新建条目并引用（必要时新建）对应 Blob。由调用方 commit。
+        """
+        existing = self._find_same_entry(checksum, original_name)
+        if existing:
+            tmp_path.unlink(missing_ok=True)
+            return existing
+
+        blob = self._acquire_blob(tmp_path, checksum, size)
+        return self._new_entry(blob.storage_path, checksum, size, original_name, content_type, note)
 
     def _file_to_dict(self, entry, request_base_url: str | None = None):
          public_url = url_for("file.public_by_name", public_name=entry.public_name, _external=True)
@@ -45,55 +241,207 @@ class FileService:
         "public_name": entry.public_name,
         "public_url": public_url,        # 例如 http://192.168.3.117:5000/api/p/123.png
         "download_url": download_url,    # 例如 http://192.168.3.117:5000/api/download/17
+        "blob_url": url_for("file.blob_by_hash", sha256_hex=entry.sha256, _external=True),  # 内容寻址，可永久缓存
+        "sha256": entry.sha256,
         # ... 其他字段
     }
 
     # ---------- 单次上传 ----------
     def single_shot_upload(self, file: FileStorage, note: Optional[str]) -> FileEntry:
+        return self.stream_upload(file.stream, file.filename, file.mimetype, note)
+
+    def stream_upload(self, stream, filename: str, content_type: Optional[str], note: Optional[str]) -> FileEntry:
+        """
+        从任意可读流（multipart 文件或原始请求体）边写边哈希落到临时文件，
+        之后只做 rename 进入存储，每个字节只写一次盘。
+        """
         tmp_path = Settings.TMP_DIR / f"{uuid.uuid4()}.part"
         ensure_parent(tmp_path)
 
         size = 0
         h = hashlib.sha256()
-        with tmp_path.open("wb") as out:
-            while True:
-                data = file.stream.read(Settings.CHUNK_SIZE)
-                if not data:
-                    break
-                out.write(data)
-                size += len(data)
-                h.update(data)
+        try:
+            with buffer_pool.buffer() as buf, tmp_path.open("wb") as out:
+                while True:
+                    n = readinto(stream, buf)
+                    if not n:
+                        break
+                    data = buf[:n]
+                    out.write(data)
+                    size += n
+                    h.update(data)
+        except Exception:
+            tmp_path.unlink(missing_ok=True)
+            raise
         checksum = h.hexdigest()
 
-        existing = FileEntry.query.filter_by(sha256=checksum, status=FileStatusEnum.active).first()
-        if existing:
-            tmp_path.unlink(missing_ok=True)
-            return existing
+        entry = self._register_entry(
+            tmp_path, checksum, size,
+            original_name=filename,
+            content_type=content_type,
+            note=note,
+        )
+        db.session.commit()
+        db.session.refresh(entry)
+        self.invalidate_meta(entry)
+        return entry
 
-        final_path = Settings.STORAGE_DIR / file.filename
-        atomic_move(tmp_path, final_path)
+    # ---------- 秒传 ----------
+    def find_by_content(self, size: int, sha256_hex: str) -> Optional[FileEntry]:
+        return FileEntry.query.filter_by(
+            sha256=sha256_hex.lower(), size=size, status=FileStatusEnum.active,
+        ).first()
 
-        safe_name = sanitize_filename(file.filename)
-        public_name = self._ensure_unique_public_name(safe_name, checksum)
+    def may_exist(self, size: int, fingerprint: str) -> bool:
+        """
+        按 (size, 抽样指纹) 判断服务端是否可能已有该内容：False 表示一定没有，客户端可跳过整文件 sha256 直接上传；
+        True 时再用 sha256 走 find_by_content 确认。指纹上线前的 Blob 没有指纹，同大小即视为可能重复。
+        """
+        return db.session.query(
+            Blob.query.filter(
+                Blob.size == size,
+                or_(Blob.fingerprint == fingerprint.lower(), Blob.fingerprint.is_(None)),
+            ).exists()
+        ).scalar()
 
-        entry = FileEntry(
-            original_name=file.filename,
-            public_name=public_name,
-            content_type=file.mimetype,
-            size=size,
-            sha256=checksum,
-            storage_path=str(final_path),
-            note=note,
-            created_at=datetime.utcnow(),
-            status=FileStatusEnum.active,
-        )
-        db.session.add(entry)
+    def instant_upload(self, filename: str, expected_size: Optional[int], expected_sha256: Optional[str], content_type: Optional[str] = None, note: Optional[str] = None) -> Optional[FileEntry]:
+        """
+        服务端已有相同 大小+sha256 的内容时直接登记新条目并返回，客户端无需再传任何字节；
+        没有命中返回 None，调用方走正常上传流程。
+        """
+        entry = self._instant_entry(filename, expected_size, expected_sha256, content_type, note)
+        if entry is None:
+            return None
         db.session.commit()
         db.session.refresh(entry)
+        self.invalidate_meta(entry)
         return entry
 
+    def _instant_entry(self, filename: str, expected_size: Optional[int], expected_sha256: Optional[str], content_type: Optional[str], note: Optional[str]) -> Optional[FileEntry]:
+        if expected_size is None or not expected_sha256:
+            return None
+        source = self.find_by_content(expected_size, expected_sha256)
+        if not source:
+            return None
+        # 不再逐次 stat：以巡检结果为准，缺失/损坏的内容不秒传，让客户端重新上传以修复；
+        # 没有 Blob 行的旧版平铺文件仍需检查
+        blob = Blob.query.get(source.sha256)
+        if blob is not None and blob.integrity in (IntegrityEnum.missing, IntegrityEnum.corrupt):
+            return None
+        if blob is None and not Path(source.storage_path).exists():
+            return None
+
+        checksum = source.sha256
+        existing = self._find_same_entry(checksum, filename)
+        if existing:
+            return existing
+
+        # 旧版平铺存储的文件没有 Blob 行，此时只共享路径不计数
+        Blob.query.filter_by(sha256=checksum).update(
+            {Blob.refcount: Blob.refcount + 1}, synchronize_session=False,
+        )
+        return self._new_entry(
+            source.storage_path, checksum, source.size, filename,
+            content_type or source.content_type, note,
+        )
+
+    # ---------- 分块去重上传（CDC） ----------
+    def missing_chunks(self, chunk_hashes: list[str]) -> list[str]:
+        try:
+            missing = chunk_store.missing_chunks(chunk_hashes)
+            db.session.commit()
+            return missing
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def put_cdc_chunk(self, sha256_hex: str, stream) -> dict:
+        return chunk_store.store_uploaded_chunk(sha256_hex, stream)
+
+    def _verify_segments(self, segments: Tuple[cdc.Segment, ...], size: int, expected_sha256: str) -> None:
+        h = hashlib.sha256()
+        for data in cdc.read_segments(segments, 0, size, Settings.BUFFER_SIZE):
+            h.update(data)
+        if h.hexdigest() != expected_sha256:
+            raise ValueError("按分块拼接后的 sha256 与声明不一致")
+
+    def commit_chunked(self, filename: str, chunk_hashes: list[str], expected_sha256: str, content_type: Optional[str], note: Optional[str]) -> FileEntry:
+        """
+        按分块清单登记文件：清单里的分块须已上传（先用 missing_chunks 查询，只传缺失的）。
+        内容已存在时直接引用；否则按序读一遍分块校验整文件 sha256，新建分块存储的 Blob。
+        """
+        if not Settings.CDC_ENABLED:
+            raise ValueError("未开启分块去重存储")
+        chunk_hashes = [h.lower() for h in chunk_hashes]
+        checksum = expected_sha256.lower()
+        try:
+            existing = self._find_same_entry(checksum, filename)
+            if existing:
+                return existing
+
+            rows = chunk_store.chunk_rows(chunk_hashes)
+            missing = [h for h in dict.fromkeys(chunk_hashes) if h not in rows]
+            if missing:
+                raise ValueError(f"分块缺失: {', '.join(missing[:10])}")
+            segments = tuple(rows[h] for h in chunk_hashes)
+            size = sum(n for _, n in segments)
+
+            verified = False
+            while True:
+                updated = (
+                    Blob.query.filter_by(sha256=checksum)
+                    .update({Blob.refcount: Blob.refcount + 1}, synchronize_session=False)
+                )
+                if updated:
+                    blob = Blob.query.get(checksum)
+                    if blob.integrity in (IntegrityEnum.missing, IntegrityEnum.corrupt):
+                        raise ValueError("服务端该内容已损坏，请整文件上传以修复")
+                    break
+                if not verified:
+                    self._verify_segments(segments, size, checksum)
+                    verified = True
+                with cdc.open_segments(segments) as f:
+                    fingerprint = fingerprint_of_fileobj(f, size)
+                blob = Blob(
+                    sha256=checksum,
+                    size=size,
+                    storage_path=f"cdc:{checksum}",
+                    chunked=True,
+                    refcount=1,
+                    fingerprint=fingerprint,
+                    integrity=IntegrityEnum.ok,
+                    verified_at=datetime.utcnow(),
+                    created_at=datetime.utcnow(),
+                )
+                try:
+                    with db.session.begin_nested():
+                        chunk_store.add_refs(chunk_hashes)
+                        db.session.add(blob)
+                        db.session.flush()
+                        chunk_store.add_manifest(checksum, [(h, n) for h, (_, n) in zip(chunk_hashes, segments)])
+                except IntegrityError:
+                    continue
+                break
+
+            entry = self._new_entry(blob.storage_path, checksum, size, filename, content_type, note)
+            db.session.commit()
+            db.session.refresh(entry)
+            self.invalidate_meta(entry)
+            return entry
+        except Exception:
+            db.session.rollback()
+            raise
+
     # ---------- 分片生命周期 ----------
-    def initiate_upload(self, filename: str, expected_size: Optional[int], expected_sha256: Optional[str]) -> str:
+    def initiate_upload(self, filename: str, expected_size: Optional[int], expected_sha256: Optional[str], chunk_size: Optional[int] = None) -> str:
+        up = self._new_upload(filename, expected_size, expected_sha256, chunk_size)
+        db.session.commit()
+        return up.id
+
+    def _new_upload(self, filename: str, expected_size: Optional[int], expected_sha256: Optional[str], chunk_size: Optional[int]) -> ResumableUpload:
+        chunk_size = chunk_size or Settings.CHUNK_SIZE
+        if expected_size is not None and -(-expected_size // chunk_size) > chunk_bitmap.MAX_CHUNKS:
+            raise ValueError(f"分片数超过 {chunk_bitmap.MAX_CHUNKS}，请增大 chunk_size")
         upload_id = str(uuid.uuid4())
         temp_path = Settings.TMP_DIR / f"{upload_id}.part"
         ensure_parent(temp_path)
@@ -104,58 +452,362 @@ class FileService:
             filename=filename,
             expected_size=expected_size,
             expected_sha256=(expected_sha256.lower() if expected_sha256 else None),
+            chunk_size=chunk_size,
             temp_path=str(temp_path),
             status=UploadStatusEnum.initiated,
             created_at=datetime.utcnow(),
             updated_at=datetime.utcnow(),
         )
         db.session.add(up)
-        db.session.commit()
-        return upload_id
+        return up
+
+    def initiate_uploads(self, items: list[dict]) -> list[dict]:
+        """
+        批量创建会话（命中已有内容的直接秒传），全部在一个事务里提交。
+        返回与 items 同序的 {"upload_id", "chunk_size", "instant", "entry"}。
+        """
+        results = []
+        try:
+            for item in items:
+                entry = self._instant_entry(
+                    item["filename"], item.get("expected_size"), item.get("expected_sha256"),
+                    item.get("content_type"), item.get("note"),
+                )
+                if entry is not None:
+                    results.append({"upload_id": None, "chunk_size": None, "instant": True, "entry": entry})
+                    continue
+                up = self._new_upload(
+                    item["filename"], item.get("expected_size"), item.get("expected_sha256"), item.get("chunk_size"),
+                )
+                results.append({"upload_id": up.id, "chunk_size": up.chunk_size, "instant": False, "entry": None})
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            for r in results:
+                if r["upload_id"]:
+                    (Settings.TMP_DIR / f"{r['upload_id']}.part").unlink(missing_ok=True)
+            raise
+        for r in results:
+            if r["entry"] is not None:
+                self.invalidate_meta(r["entry"])
+        return results
+
+    def _lock_upload(self, upload_id: str) -> Optional[ResumableUpload]:
+        # 行锁串行化同一会话的位图更新与分片拼入；分片数据在加锁前已并发写到各自的暂存文件
+        return (
+            ResumableUpload.query.filter_by(id=upload_id)
+            .with_for_update()
+            .populate_existing()
+            .first()
+        )
+
+    def _total_chunks(self, up: ResumableUpload) -> Optional[int]:
+        if up.expected_size is None:
+            return None
+        return (up.expected_size + up.chunk_size - 1) // up.chunk_size
+
+    def _expected_chunk_size(self, up: ResumableUpload, index: int) -> Optional[int]:
+        total = self._total_chunks(up)
+        if total is None:
+            return None
+        if index < total - 1:
+            return up.chunk_size
+        return up.expected_size - (total - 1) * up.chunk_size
+
+    def _chunk_status(self, up: ResumableUpload) -> dict:
+        return {
+            "upload_id": up.id,
+            "status": up.status,
+            "received_bytes": up.received_bytes,
+            "received_chunks": up.received_count,
+            "total_chunks": self._total_chunks(up),
+            "next_index": chunk_bitmap.first_missing(up.received_bitmap),
+        }
+
+    def get_upload_manifest(self, upload_id: str) -> dict:
+        """
+        断点续传清单：已接收的分片区间及对应字节区间，只读会话行，不扫描分片表。
+        """
+        up = ResumableUpload.query.get(upload_id)
+        if not up:
+            raise ValueError("会话不存在")
+        runs = chunk_bitmap.ranges(up.received_bitmap)
+        if up.expected_size is not None:
+            file_end = up.expected_size
+        elif runs:
+            # 大小未知时只有最高位分片可能是短片，其余都是满片，由计数反推它的长度
+            file_end = (runs[-1][1] - 1) * up.chunk_size + up.received_bytes - (up.received_count - 1) * up.chunk_size
+        else:
+            file_end = 0
+        manifest = self._chunk_status(up)
+        manifest.update({
+            "chunk_size": up.chunk_size,
+            "expected_size": up.expected_size,
+            "chunk_ranges": [[start, end] for start, end in runs],
+            "byte_ranges": [
+                [start * up.chunk_size, min(end * up.chunk_size, file_end)] for start, end in runs
+            ],
+        })
+        return manifest
 
     def put_chunk(self, upload_id: str, index: int, chunk: FileStorage, chunk_sha256: Optional[str]) -> dict:
+        return self.put_chunk_stream(upload_id, index, chunk.stream, chunk_sha256)
+
+    def put_chunk_stream(self, upload_id: str, index: int, stream, chunk_sha256: Optional[str]) -> dict:
         up = ResumableUpload.query.get(upload_id)
         if not up or up.status in (UploadStatusEnum.committed, UploadStatusEnum.aborted):
             raise ValueError("Upload not found or already finalized")
 
-        temp_path = Path(up.temp_path)
-        expected_index = UploadChunk.query.filter_by(upload_id=upload_id).count()
-        if index != expected_index:
-            raise ValueError(f"Unexpected chunk index {index}, expected {expected_index}")
+        written = self._write_chunk(up, index, stream, chunk_sha256)
+        if written is None:
+            # 重传已确认的分片：幂等返回，不再落盘
+            return self._chunk_status(up)
 
-        h = hashlib.sha256()
-        bytes_written = 0
-        with temp_path.open("ab") as out:
-            while True:
-                data = chunk.stream.read(Settings.CHUNK_SIZE)
-                if not data:
-                    break
-                out.write(data)
-                bytes_written += len(data)
-                h.update(data)
-        chk = h.hexdigest()
+        try:
+            up = self._lock_upload(upload_id)
+            if not up or up.status in (UploadStatusEnum.committed, UploadStatusEnum.aborted):
+                db.session.rollback()
+                raise ValueError("Upload not found or already finalized")
+            self._record_chunk(up, index, *written)
+            db.session.commit()
+        finally:
+            written[2].unlink(missing_ok=True)
 
-        if chunk_sha256 and chunk_sha256.lower() != chk:
-            # 回滚尾部
-            with temp_path.open("rb+") as f:
-                f.truncate(temp_path.stat().st_size - bytes_written)
-            raise ValueError("Chunk checksum mismatch")
+        self._advance_hasher(up, Path(up.temp_path))
+        return self._chunk_status(up)
 
+    def _write_chunk(self, up: ResumableUpload, index: int, stream, chunk_sha256: Optional[str]) -> Optional[Tuple[int, str, Path]]:
+        """
+        校验下标并把分片数据写到暂存文件，返回 (字节数, sha256, 暂存文件)；已确认过的分片返回 None。
+        只写盘不动数据库也不碰会话临时文件，由 _record_chunk 在行锁内拼入并更新位图，
+        并发重传同一分片时不会覆盖已确认、甚至已在提交中的区间。暂存文件由调用方删除。
+        """
+        total = self._total_chunks(up)
+        if index < 0 or index >= (total if total is not None else chunk_bitmap.MAX_CHUNKS):
+            raise ValueError(f"Chunk index {index} out of range")
+        if chunk_bitmap.has_bit(up.received_bitmap, index):
+            return None
+
+        # 分片可乱序、可多个请求并发写各自的暂存文件；孤儿暂存文件由 UploadReaper 按 .tmp 清理
+        staging = Settings.TMP_DIR / f"{up.id}.{index}.{uuid.uuid4().hex}.tmp"
+        try:
+            staging.touch()
+            bytes_written, chk = write_stream_at(staging, 0, stream, up.chunk_size)
+
+            expected = self._expected_chunk_size(up, index)
+            if expected is not None and bytes_written != expected:
+                raise ValueError(f"Chunk {index} size mismatch: got {bytes_written}, expected {expected}")
+            if chunk_sha256 and chunk_sha256.lower() != chk:
+                raise ValueError("Chunk checksum mismatch")
+        except BaseException:
+            staging.unlink(missing_ok=True)
+            raise
+        return bytes_written, chk, staging
+
+    def _record_chunk(self, up: ResumableUpload, index: int, size: int, chk: str, staging: Path) -> None:
+        # 调用方需已通过 _lock_upload 持有行锁；位图已置位说明并发请求先确认了该分片，丢弃本次数据
+        if chunk_bitmap.has_bit(up.received_bitmap, index):
+            return
+        copy_into(staging, Path(up.temp_path), index * up.chunk_size)
+        up.received_bitmap = chunk_bitmap.set_bit(up.received_bitmap, index)
+        up.received_count = (up.received_count or 0) + 1
+        up.received_bytes = (up.received_bytes or 0) + size
         up.status = UploadStatusEnum.receiving
         up.updated_at = datetime.utcnow()
-        db.session.add(UploadChunk(upload_id=upload_id, index=index, size=bytes_written, sha256=chk))
-        db.session.commit()
+        db.session.add(UploadChunk(upload_id=up.id, index=index, size=size, sha256=chk))
 
-        received = temp_path.stat().st_size
-        return {
-            "upload_id": upload_id,
-            "status": up.status,
-            "received_bytes": received,
-            "next_index": index + 1,
-        }
+    def put_chunks_batch(self, frames) -> dict:
+        """
+        一个请求体里写入多个分片（可跨多个会话）：数据逐帧落到暂存文件，拼入与位图、分片记录在一个事务里提交。
+        frames 为 (头, 数据流) 的迭代器，见 app.vendors.batch_frames。单帧失败不影响其它帧。
+        """
+        uploads: dict[str, Optional[ResumableUpload]] = {}
+        results, written = [], []
+        try:
+            for header, payload in frames:
+                upload_id, index = str(header.get("upload_id")), header.get("index")
+                item = {"upload_id": upload_id, "index": index, "ok": False}
+                results.append(item)
+                if upload_id not in uploads:
+                    uploads[upload_id] = ResumableUpload.query.get(upload_id)
+                up = uploads[upload_id]
+                if not up or up.status in (UploadStatusEnum.committed, UploadStatusEnum.aborted):
+                    item["error"] = "Upload not found or already finalized"
+                    continue
+                try:
+                    res = self._write_chunk(up, int(index), payload, header.get("sha256"))
+                except (ValueError, TypeError, OSError) as e:
+                    item["error"] = str(e)
+                    continue
+                item["ok"] = True
+                if res is not None:
+                    written.append((upload_id, int(index), *res))
+
+            touched = sorted({w[0] for w in written})
+            if touched:
+                # 按主键顺序一次性加锁，避免与其它批次互相死锁
+                locked = {
+                    up.id: up for up in ResumableUpload.query.filter(ResumableUpload.id.in_(touched))
+                    .order_by(ResumableUpload.id).with_for_update().populate_existing()
+                }
+                for upload_id, index, size, chk, staging in written:
+                    up = locked.get(upload_id)
+                    if not up or up.status in (UploadStatusEnum.committed, UploadStatusEnum.aborted):
+                        continue
+                    self._record_chunk(up, index, size, chk, staging)
+                db.session.commit()
+                for up in locked.values():
+                    self._advance_hasher(up, Path(up.temp_path))
+        finally:
+            for w in written:
+                w[4].unlink(missing_ok=True)
+
+        statuses = {}
+        for upload_id, up in uploads.items():
+            if up is not None:
+                statuses[upload_id] = self._chunk_status(up)
+        return {"items": results, "uploads": statuses}
+
+    def _advance_hasher(self, up: ResumableUpload, temp_path: Path) -> None:
+        # 把整文件哈希推进到“连续已接收前缀”的末尾；别的请求正在推进时直接跳过，由它或提交时补齐
+        contiguous = chunk_bitmap.first_missing(up.received_bitmap)
+        total = self._total_chunks(up)
+        if total is not None and contiguous >= total:
+            end = up.expected_size
+        else:
+            # 大小未知时前缀最后一片可能是短的末片，先不计入
+            end = max(contiguous - (0 if total is not None else 1), 0) * up.chunk_size
+        hasher = self._hashers.get(up.id, create=True)
+        if not hasher.lock.acquire(blocking=False):
+            return
+        try:
+            hasher.catch_up(temp_path, end)
+        except (OSError, ValueError):
+            self._hashers.discard(up.id)
+        finally:
+            hasher.lock.release()
 
-    def commit_upload(self, upload_id: str, expected_size: Optional[int], expected_sha256: Optional[str], content_type: Optional[str], note: Optional[str]) -> FileEntry:
+    def commit_upload(self, upload_id: str, expected_size: Optional[int], expected_sha256: Optional[str], content_type: Optional[str], note: Optional[str], expected_merkle_root: Optional[str] = None, job: Optional[CommitJob] = None) -> FileEntry:
+        """
+        job 非空时（异步提交）任务状态与合并结果在同一事务里落库，崩溃后不会出现“已合并但任务未完成”。
+        合并前按租约令牌锁住任务行，令牌已不匹配（被重新排队）时不动临时文件直接放弃；
+        锁住期间续约与回收都跳过该行，任务不会在合并途中被别的工作线程接手。
+        """
+        try:
+            if job is not None:
+                token = job.lease_token
+                job = (
+                    CommitJob.query.filter_by(id=job.id, lease_token=token, status=CommitJobStatusEnum.running)
+                    .with_for_update()
+                    .populate_existing()
+                    .first()
+                )
+                if job is None:
+                    raise ValueError("提交任务租约已失效")
+            entry = self._finalize_upload(upload_id, expected_size, expected_sha256, content_type, note, expected_merkle_root)
+            if job is not None:
+                db.session.flush()
+                job.file_id = entry.id
+                job.status = CommitJobStatusEnum.succeeded
+                job.updated_at = datetime.utcnow()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        db.session.refresh(entry)
+        self.invalidate_meta(entry)
+        return entry
+
+    # ---------- 异步提交 ----------
+    def enqueue_commit(self, upload_id: str, params: dict) -> CommitJob:
+        """
+        登记异步提交任务并立即返回；同一会话已有排队/执行中的任务时直接返回它。
+        """
         up = ResumableUpload.query.get(upload_id)
+        if not up or up.status in (UploadStatusEnum.committed, UploadStatusEnum.aborted):
+            raise ValueError("Upload not found or already finalized")
+        existing = CommitJob.query.filter(
+            CommitJob.upload_id == upload_id,
+            CommitJob.status.in_((CommitJobStatusEnum.queued, CommitJobStatusEnum.running)),
+        ).first()
+        if existing:
+            return existing
+        try:
+            device = os.stat(up.temp_path).st_dev
+        except FileNotFoundError:
+            device = 0
+        now = datetime.utcnow()
+        job = CommitJob(
+            id=str(uuid.uuid4()),
+            upload_id=upload_id,
+            params=json.dumps(params, ensure_ascii=False),
+            status=CommitJobStatusEnum.queued,
+            device=device,
+            created_at=now,
+            updated_at=now,
+        )
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    def run_commit_job(self, job_id: str, lease_token: str) -> None:
+        # 调用方已把任务置为 running 并持有租约；成功与否都在这里落库，令牌不匹配时不改状态
+        job = CommitJob.query.get(job_id)
+        if not job or job.status != CommitJobStatusEnum.running or job.lease_token != lease_token:
+            return
+        params = json.loads(job.params or "{}")
+        try:
+            self.commit_upload(
+                job.upload_id,
+                params.get("expected_size"), params.get("expected_sha256"),
+                params.get("content_type"), params.get("note"), params.get("expected_merkle_root"),
+                job=job,
+            )
+        except Exception as e:
+            CommitJob.query.filter_by(id=job_id, lease_token=lease_token, status=CommitJobStatusEnum.running).update(
+                {CommitJob.status: CommitJobStatusEnum.failed, CommitJob.error: str(e)[:2000], CommitJob.updated_at: datetime.utcnow()},
+                synchronize_session=False,
+            )
+            db.session.commit()
+
+    def get_commit_job(self, job_id: str) -> Optional[CommitJob]:
+        return CommitJob.query.get(job_id)
+
+    def commit_uploads(self, items: list[dict]) -> list[dict]:
+        """
+        批量提交：每个会话在各自的保存点里合并，失败的只回滚自己，成功的最后一次性提交。
+        返回与 items 同序的 {"upload_id", "entry" | "error"}；upload_id 重复时抛 ValueError。
+        """
+        if len({item["upload_id"] for item in items}) != len(items):
+            raise ValueError("同一批次中 upload_id 不能重复")
+        results = {}
+        # 按 upload_id 顺序加锁，避免并发批次互相死锁
+        for item in sorted(items, key=lambda it: it["upload_id"]):
+            upload_id = item["upload_id"]
+            try:
+                with db.session.begin_nested():
+                    entry = self._finalize_upload(
+                        upload_id, item.get("expected_size"), item.get("expected_sha256"),
+                        item.get("content_type"), item.get("note"), item.get("expected_merkle_root"),
+                    )
+                results[upload_id] = {"upload_id": upload_id, "entry": entry}
+            except (ValueError, FileNotFoundError) as e:
+                results[upload_id] = {"upload_id": upload_id, "error": str(e)}
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        for r in results.values():
+            if "entry" in r:
+                self.invalidate_meta(r["entry"])
+        return [results[item["upload_id"]] for item in items]
+
+    def _finalize_upload(self, upload_id: str, expected_size: Optional[int], expected_sha256: Optional[str], content_type: Optional[str], note: Optional[str], expected_merkle_root: Optional[str] = None) -> FileEntry:
+        """
+        校验并合并一个会话，只改会话内状态、不提交也不回滚，失败直接抛错由调用方处理事务。
+        """
+        up = self._lock_upload(upload_id)
         if not up or up.status in (UploadStatusEnum.committed, UploadStatusEnum.aborted):
             raise ValueError("Upload not found or already finalized")
 
@@ -163,52 +815,66 @@ class FileService:
         if not temp_path.exists():
             raise FileNotFoundError("Temporary file missing")
 
-        size = temp_path.stat().st_size
+        # 完整性检查：0..total-1 的分片都已到达，且除最后一片外都是满片
+        total = self._total_chunks(up)
+        if total is None:
+            total = chunk_bitmap.highest_bit(up.received_bitmap) + 1
+        missing = chunk_bitmap.missing_indexes(up.received_bitmap, total, limit=20)
+        if missing:
+            raise ValueError(f"Missing chunks: {missing}")
+
+        size = up.received_bytes or 0
+        if total > 0:
+            last = UploadChunk.query.filter_by(upload_id=upload_id, index=total - 1).first()
+            if up.received_count != total or size != (total - 1) * up.chunk_size + last.size:
+                raise ValueError("Chunks leave gaps in the file")
+        if temp_path.stat().st_size != size:
+            # 拼入后事务回滚的分片可能在尾部留下多余字节
+            os.truncate(temp_path, size)
+
         exp_size = expected_size or up.expected_size
         if exp_size is not None and size != exp_size:
             raise ValueError(f"Size mismatch: got {size}, expected {exp_size}")
 
-        checksum = sha256_of_path(temp_path)
+        chunk_hashes = [
+            h for (h,) in db.session.query(UploadChunk.sha256)
+            .filter(UploadChunk.upload_id == upload_id)
+            .order_by(UploadChunk.index)
+        ]
+        up.merkle_root = merkle_root(chunk_hashes)
+        if expected_merkle_root and up.merkle_root != expected_merkle_root.lower():
+            raise ValueError("Merkle root mismatch")
+
+        checksum = self._whole_file_sha256(upload_id, temp_path, size)
         exp_hash = (expected_sha256 or up.expected_sha256)
         if exp_hash and checksum.lower() != exp_hash.lower():
             raise ValueError("SHA256 mismatch")
 
-        existing = FileEntry.query.filter_by(sha256=checksum, status=FileStatusEnum.active).first()
-        if existing:
-            temp_path.unlink(missing_ok=True)
-            up.status = UploadStatusEnum.committed
-            up.updated_at = datetime.utcnow()
-            db.session.commit()
-            return existing
-
-        final_path = Settings.STORAGE_DIR / up.filename
-        atomic_move(temp_path, final_path)
-
-        safe_name = sanitize_filename(up.filename)
-        public_name = self._ensure_unique_public_name(safe_name, checksum)
-
-        entry = FileEntry(
+        self._hashers.discard(upload_id)
+        entry = self._register_entry(
+            temp_path, checksum, size,
             original_name=up.filename,
-            public_name=public_name,
             content_type=content_type,
-            size=size,
-            sha256=checksum,
-            storage_path=str(final_path),
-            created_at=datetime.utcnow(),
-            status=FileStatusEnum.active,
             note=note,
         )
-        db.session.add(entry)
         up.status = UploadStatusEnum.committed
         up.updated_at = datetime.utcnow()
-        db.session.commit()
-        db.session.refresh(entry)
         return entry
 
+    def _whole_file_sha256(self, upload_id: str, temp_path: Path, size: int) -> str:
+        hasher = self._hashers.get(upload_id)
+        if hasher is None or hasher.offset > size:
+            return sha256_of_path(temp_path)
+        with hasher.lock:
+            hasher.catch_up(temp_path, size)
+            return hasher.hexdigest()
+
     def abort_upload(self, upload_id: str) -> None:
-        up = ResumableUpload.query.get(upload_id)
+        # 加行锁：与正在拼入分片、正在提交的请求串行
+        up = self._lock_upload(upload_id)
         if not up:
             raise ValueError("会话不存在")
+        self._hashers.discard(upload_id)
         Path(up.temp_path).unlink(missing_ok=True)
         UploadChunk.query.filter_by(upload_id=upload_id).delete()
         up.status = UploadStatusEnum.aborted
@@ -216,11 +882,131 @@ class FileService:
         db.session.commit()
 
     # ---------- 查询 / 下载 ----------
-    def list_files(self) -> list[FileEntry]:
-        return FileEntry.query.filter_by(status=FileStatusEnum.active).order_by(FileEntry.created_at.desc()).all()
+    def active_files_query(self):
+        # 排序交给 utils.pagination.paginate_keyset（created_at, id 倒序），命中 ix_file_status_created
+        return FileEntry.query.filter_by(status=FileStatusEnum.active)
 
     def get_file(self, file_id: int) -> Optional[FileEntry]:
         row = FileEntry.query.get(file_id)
         if not row or row.status != FileStatusEnum.active:
             return None
         return row
+
+    def buffer_stats(self) -> dict:
+        return buffer_pool.stats()
+
+    # ---------- 打包下载 ----------
+    def archive_members(self, ids: Optional[list[int]] = None, since: Optional[datetime] = None, until: Optional[datetime] = None, content_type: Optional[str] = None) -> list[ArchiveMember]:
+        """
+        一次查出全部成员的元数据（含打包偏移、分块清单），之后的流式输出不再访问数据库。
+        成员名用 public_name：已清洗且唯一，解压时不会互相覆盖或越出目录。
+        """
+        query = FileEntry.query.filter(FileEntry.status == FileStatusEnum.active)
+        if ids:
+            query = query.filter(FileEntry.id.in_(ids))
+        if since:
+            query = query.filter(FileEntry.created_at >= since)
+        if until:
+            query = query.filter(FileEntry.created_at < until)
+        if content_type:
+            query = query.filter(FileEntry.content_type.startswith(content_type, autoescape=True))
+        rows = query.order_by(FileEntry.id).limit(Settings.ARCHIVE_MAX_FILES).all()
+
+        blobs = {}
+        shas = sorted({r.sha256 for r in rows})
+        for i in range(0, len(shas), 500):
+            for b in Blob.query.filter(Blob.sha256.in_(shas[i:i + 500])):
+                blobs[b.sha256] = b
+        members = []
+        for r in rows:
+            blob = blobs.get(r.sha256)
+            segments = chunk_store.manifest_segments(blob.sha256) if blob is not None and blob.chunked else ()
+            members.append(ArchiveMember(
+                name=r.public_name,
+                path=Path(r.storage_path),
+                size=r.size,
+                content_type=r.content_type,
+                modified=r.created_at,
+                offset=blob.pack_offset if blob else None,
+                segments=segments,
+            ))
+        return members
+
+    # ---------- 删除 ----------
+    def delete_files(self, file_ids: list[int]) -> list[int]:
+        """
+        只把状态改为 deleted 并立即返回，磁盘空间由后台 BlobReclaimer 按引用计数回收。
+        返回本次实际删除的 id。
+        """
+        rows = (
+            db.session.query(FileEntry.id, FileEntry.public_name, FileEntry.sha256)
+            .filter(FileEntry.id.in_(file_ids), FileEntry.status == FileStatusEnum.active)
+            .all()
+        )
+        if not rows:
+            return []
+        try:
+            FileEntry.query.filter(
+                FileEntry.id.in_([r.id for r in rows]), FileEntry.status == FileStatusEnum.active,
+            ).update({FileEntry.status: FileStatusEnum.deleted}, synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        for r in rows:
+            self.invalidate_meta(r)
+        return [r.id for r in rows]
+
+    # ---------- 元数据缓存 ----------
+    def _load_meta(self, row: Optional[FileEntry]) -> Optional[FileMeta]:
+        if not row:
+            return None
+        blob = Blob.query.get(row.sha256)
+        segments = chunk_store.manifest_segments(blob.sha256) if blob is not None and blob.chunked else ()
+        meta = FileMeta.from_row(row, blob, segments)
+        self._meta_cache.set(("id", meta.id), meta)
+        self._meta_cache.set(("name", meta.public_name), meta)
+        return meta
+
+    def get_file_meta(self, file_id: int) -> Optional[FileMeta]:
+        meta = self._meta_cache.get(("id", file_id))
+        if meta is None:
+            meta = self._load_meta(FileEntry.query.get(file_id))
+        return meta
+
+    def get_public_meta(self, public_name: str) -> Optional[FileMeta]:
+        meta = self._meta_cache.get(("name", public_name))
+        if meta is None:
+            meta = self._load_meta(FileEntry.query.filter_by(public_name=public_name).first())
+        return meta
+
+    def get_blob_meta(self, sha256_hex: str) -> Optional[FileMeta]:
+        # 内容寻址访问：任一引用该内容的有效条目都可提供 content_type
+        sha256_hex = sha256_hex.lower()
+        meta = self._meta_cache.get(("sha", sha256_hex))
+        if meta is None:
+            row = FileEntry.query.filter_by(sha256=sha256_hex, status=FileStatusEnum.active).first()
+            meta = self._load_meta(row)
+            if meta is not None:
+                self._meta_cache.set(("sha", sha256_hex), meta)
+        return meta
+
+    def invalidate_meta(self, entry) -> None:
+        self._meta_cache.delete(("id", entry.id))
+        self._meta_cache.delete(("name", entry.public_name))
+        self._meta_cache.delete(("sha", entry.sha256))
+
+    # ---------- 图片派生 ----------
+    def get_derivative(self, meta: FileMeta, params: DerivativeParams) -> Path:
+        def open_source():
+            # 缓存命中时不会调用：不读包文件、不打开分块
+            path = Path(meta.storage_path)
+            if meta.segments:
+                return cdc.open_segments(meta.segments)
+            if meta.pack_offset is not None:
+                return io.BytesIO(pack_store.read(path, meta.pack_offset, meta.size))
+            return path
+        return self._derivatives.get_or_create(meta.sha256, params, open_source)
+
+    def purge_derivatives(self, sha256_hex: str) -> int:
+        return self._derivatives.purge(sha256_hex)
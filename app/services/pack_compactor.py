@@ -0,0 +1,82 @@
+import io
+import logging
+import time
+from pathlib import Path
+
+from app.models import db
+from app.models.file import Blob, FileEntry
+from app.vendors import pack_store
+from app.vendors.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+class PackCompactor:
+    """
+    包文件压缩：有效数据占比低于 PACK_COMPACT_RATIO 的已封包，把仍被引用的对象逐个（行锁内）
+    追加到当前包并改写位置，全部迁走后等过元数据缓存 TTL 再删除旧包。
+    已删除对象与事务回滚留下的无主字节随旧包一起释放。
+    """
+
+    def _move_one(self, sha256_hex: str, pack: Path, report: dict) -> None:
+        blob = (
+            Blob.query.filter_by(sha256=sha256_hex)
+            .with_for_update()
+            .populate_existing()
+            .first()
+        )
+        if blob is None or blob.storage_path != str(pack) or blob.pack_offset is None:
+            db.session.commit()
+            return
+        data = pack_store.read(pack, blob.pack_offset, blob.size)
+        new_path, new_offset = pack_store.append(pack.parent.parent, io.BytesIO(data), blob.size)
+        FileEntry.query.filter_by(sha256=blob.sha256, storage_path=blob.storage_path).update(
+            {FileEntry.storage_path: str(new_path)}, synchronize_session=False
+        )
+        blob.storage_path, blob.pack_offset = str(new_path), new_offset
+        db.session.commit()
+        report["moved"] += 1
+        report["moved_bytes"] += blob.size
+
+    def run_once(self) -> dict:
+        started = time.monotonic()
+        report = {"packs": 0, "compacted": 0, "moved": 0, "moved_bytes": 0, "failed": 0, "freed_bytes": 0}
+        emptied = []
+        for root, _ in Settings.STORAGE_ROOTS:
+            for pack in pack_store.sealed_packs(root):
+                report["packs"] += 1
+                live = (
+                    db.session.query(Blob.sha256, Blob.size)
+                    .filter(Blob.storage_path == str(pack), Blob.pack_offset.isnot(None))
+                    .order_by(Blob.sha256)
+                    .all()
+                )
+                db.session.commit()
+                pack_size = pack.stat().st_size
+                live_bytes = sum(r.size for r in live)
+                if pack_size and live_bytes >= pack_size * Settings.PACK_COMPACT_RATIO:
+                    continue
+                failed = 0
+                for r in live:
+                    try:
+                        self._move_one(r.sha256, pack, report)
+                    except Exception:
+                        db.session.rollback()
+                        logger.exception("Blob %s 迁出包 %s 失败", r.sha256, pack)
+                        failed += 1
+                if failed:
+                    # 还有对象留在旧包里，不能删；下一轮再迁剩下的
+                    report["failed"] += failed
+                    continue
+                report["compacted"] += 1
+                emptied.append((pack, pack_size))
+
+        if emptied:
+            # 各进程缓存里的旧位置过期后再删，期间旧包仍可读
+            time.sleep(Settings.META_CACHE_TTL)
+            for pack, pack_size in emptied:
+                pack.unlink(missing_ok=True)
+                report["freed_bytes"] += pack_size
+
+        report["seconds"] = round(time.monotonic() - started, 3)
+        logger.info("打包存储压缩完成: %s", report)
+        return report
@@ -0,0 +1,87 @@
+import logging
+import time
+from pathlib import Path
+
+from app.models import db
+from app.models.file import Blob, FileEntry
+from app.vendors.precompress import build_variants, format_encodings, variant_path
+from app.vendors.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+class Precompressor:
+    """
+    为新入库的整文件 Blob 补建 .br / .gz 变体：不持锁不开事务地读文件压缩，
+    写好变体后再按 storage_path 条件更新 encodings 并置 precompressed。
+    期间 Blob 被迁移、转分块或回收（条件不再成立）时删掉刚写的变体，迁移后的新位置下一轮再处理。
+    各进程的元数据缓存过期（META_CACHE_TTL）后下载才会用上新变体。
+    """
+
+    def __init__(self) -> None:
+        self.last_report: dict = {}
+
+    def _content_type(self, sha256_hex: str):
+        # Blob 不记类型，取任一引用它的条目的类型
+        row = db.session.query(FileEntry.content_type).filter_by(sha256=sha256_hex).first()
+        return row.content_type if row else None
+
+    def _process(self, row, report: dict) -> None:
+        path = Path(row.storage_path)
+        content_type = self._content_type(row.sha256)
+        db.session.commit()
+        try:
+            variants = build_variants(path, row.size, content_type)
+        except FileNotFoundError:
+            report["missing"] += 1
+            return
+        updated = (
+            Blob.query.filter_by(sha256=row.sha256, storage_path=row.storage_path, chunked=False)
+            .update(
+                {Blob.encodings: format_encodings(variants), Blob.precompressed: True},
+                synchronize_session=False,
+            )
+        )
+        db.session.commit()
+        if not updated:
+            for encoding in variants:
+                variant_path(path, encoding).unlink(missing_ok=True)
+            report["skipped"] += 1
+            return
+        report["compressed" if variants else "incompressible"] += 1
+
+    def run_once(self) -> dict:
+        started = time.monotonic()
+        report = {"scanned": 0, "compressed": 0, "incompressible": 0, "skipped": 0, "missing": 0}
+        last_sha = ""
+        while True:
+            rows = (
+                db.session.query(Blob.sha256, Blob.storage_path, Blob.size)
+                .filter(
+                    Blob.sha256 > last_sha,
+                    Blob.precompressed.is_(False),
+                    Blob.chunked.is_(False),
+                    Blob.pack_offset.is_(None),
+                    Blob.refcount > 0,
+                    Blob.size >= Settings.PRECOMPRESS_MIN_SIZE,
+                    Blob.size <= Settings.PRECOMPRESS_MAX_SIZE,
+                )
+                .order_by(Blob.sha256)
+                .limit(Settings.PRECOMPRESS_BATCH_SIZE)
+                .all()
+            )
+            db.session.commit()
+            if not rows:
+                break
+            last_sha = rows[-1].sha256
+            report["scanned"] += len(rows)
+            for row in rows:
+                try:
+                    self._process(row, report)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception("Blob %s 预压缩失败", row.sha256)
+
+        report["seconds"] = round(time.monotonic() - started, 3)
+        self.last_report = report
+        logger.info("预压缩完成: %s", report)
+        return report
@@ -0,0 +1,116 @@
+import logging
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from app.models import db
+from app.models.file import CommitJob, CommitJobStatusEnum, ResumableUpload, UploadChunk, UploadStatusEnum
+from app.vendors.settings import Settings
+from app.vendors.throttle import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = (UploadStatusEnum.initiated, UploadStatusEnum.receiving)
+
+class UploadReaper:
+    """
+    回收超过 UPLOAD_SESSION_TTL 未活动的分片会话及其 .part 文件，
+    清理已结束的旧会话行与提交任务行，以及 TMP_DIR 中没有任何会话引用的孤儿临时文件。
+    删除文件按 REAPER_IO_BYTES_PER_SEC 限速，批次之间休眠，避免与在线上传争抢磁盘。
+    """
+
+    def __init__(self, file_service=None) -> None:
+        self.file_service = file_service
+        self.last_report: dict = {}
+
+    def _unlink(self, path: Path, limiter: RateLimiter, report: dict) -> None:
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except FileNotFoundError:
+            return
+        report["temp_files"] += 1
+        report["bytes"] += size
+        # 删除大文件同样要释放大量 extent，按大小计入限速，最少按 64KB 计
+        limiter.consume(max(size, 64 * 1024))
+
+    def _reap_sessions(self, cutoff: datetime, limiter: RateLimiter, report: dict) -> None:
+        while True:
+            batch = (
+                ResumableUpload.query
+                .filter(ResumableUpload.updated_at < cutoff)
+                .order_by(ResumableUpload.updated_at)
+                .limit(Settings.REAPER_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            if not batch:
+                db.session.commit()
+                return
+            ids = [up.id for up in batch]
+            for up in batch:
+                if up.status in ACTIVE_STATUSES:
+                    report["stale_sessions"] += 1
+                    if self.file_service is not None:
+                        self.file_service._hashers.discard(up.id)
+                    self._unlink(Path(up.temp_path), limiter, report)
+                else:
+                    report["finished_sessions"] += 1
+            report["chunk_rows"] += (
+                UploadChunk.query.filter(UploadChunk.upload_id.in_(ids))
+                .delete(synchronize_session=False)
+            )
+            ResumableUpload.query.filter(ResumableUpload.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+            time.sleep(Settings.REAPER_BATCH_PAUSE)
+
+    def _reap_orphans(self, cutoff_ts: float, limiter: RateLimiter, report: dict) -> None:
+        # 只动早于截止时间的文件：进行中的单次上传临时文件同样没有会话行
+        candidates = []
+        for path in Settings.TMP_DIR.iterdir():
+            if not path.is_file() or not path.name.endswith((".part", ".tmp")):
+                continue
+            try:
+                if path.stat().st_mtime >= cutoff_ts:
+                    continue
+            except FileNotFoundError:
+                continue
+            candidates.append(path)
+
+        for i in range(0, len(candidates), Settings.REAPER_BATCH_SIZE):
+            group = candidates[i:i + Settings.REAPER_BATCH_SIZE]
+            referenced = {
+                p for (p,) in db.session.query(ResumableUpload.temp_path)
+                .filter(ResumableUpload.temp_path.in_([str(p) for p in group]))
+            }
+            db.session.commit()
+            for path in group:
+                if str(path) not in referenced:
+                    report["orphan_files"] += 1
+                    self._unlink(path, limiter, report)
+            time.sleep(Settings.REAPER_BATCH_PAUSE)
+
+    def run_once(self) -> dict:
+        started = time.monotonic()
+        ttl = Settings.UPLOAD_SESSION_TTL
+        cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+        limiter = RateLimiter(Settings.REAPER_IO_BYTES_PER_SEC)
+        report = {
+            "stale_sessions": 0,
+            "finished_sessions": 0,
+            "chunk_rows": 0,
+            "orphan_files": 0,
+            "temp_files": 0,
+            "bytes": 0,
+        }
+        self._reap_sessions(cutoff, limiter, report)
+        report["commit_jobs"] = CommitJob.query.filter(
+            CommitJob.status.in_((CommitJobStatusEnum.succeeded, CommitJobStatusEnum.failed)),
+            CommitJob.updated_at < cutoff,
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        self._reap_orphans(time.time() - ttl, limiter, report)
+        report["seconds"] = round(time.monotonic() - started, 3)
+        self.last_report = report
+        logger.info("上传回收完成: %s", report)
+        return report
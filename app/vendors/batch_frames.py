@@ -0,0 +1,79 @@
+import json
+import struct
+from typing import Iterator, Tuple
+
+from app.vendors.buffer_pool import readinto as _readinto
+
+# 批量分片的帧格式（application/octet-stream 请求体，顺序排列直到 EOF）：
+#   4 字节大端头长度 N | N 字节 UTF-8 JSON 头 {"upload_id", "index", "size", "sha256"?} | size 字节分片数据
+HEADER_LEN = struct.Struct(">I")
+MAX_HEADER_BYTES = 64 * 1024
+
+class FramePayload:
+    """单帧数据的有界只读流，读到 size 字节即 EOF"""
+
+    def __init__(self, stream, size: int) -> None:
+        self._stream = stream
+        self.remaining = size
+
+    def read(self, n: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b""
+        if n is None or n < 0 or n > self.remaining:
+            n = self.remaining
+        data = self._stream.read(n)
+        if not data:
+            raise ValueError("批量请求体在帧数据中途结束")
+        self.remaining -= len(data)
+        return data
+
+    def readinto(self, view) -> int:
+        if self.remaining <= 0:
+            return 0
+        n = _readinto(self._stream, view[:min(len(view), self.remaining)])
+        if not n:
+            raise ValueError("批量请求体在帧数据中途结束")
+        self.remaining -= n
+        return n
+
+    def drain(self, block_size: int = 1024 * 1024) -> None:
+        while self.remaining > 0:
+            self.read(min(block_size, self.remaining))
+
+def _read_exact(stream, n: int) -> bytes:
+    buf = b""
+    while len(buf) < n:
+        data = stream.read(n - len(buf))
+        if not data:
+            break
+        buf += data
+    return buf
+
+def iter_frames(stream, max_frames: int) -> Iterator[Tuple[dict, FramePayload]]:
+    """
+    逐帧产出 (头, 数据流)。调用方不必读完数据，进入下一帧前会自动跳过剩余字节。
+    """
+    count = 0
+    while True:
+        raw_len = _read_exact(stream, HEADER_LEN.size)
+        if not raw_len:
+            return
+        if len(raw_len) < HEADER_LEN.size:
+            raise ValueError("批量请求体帧头不完整")
+        (header_len,) = HEADER_LEN.unpack(raw_len)
+        if header_len > MAX_HEADER_BYTES:
+            raise ValueError("批量请求体帧头过大")
+        raw_header = _read_exact(stream, header_len)
+        if len(raw_header) < header_len:
+            raise ValueError("批量请求体帧头不完整")
+        header = json.loads(raw_header.decode("utf-8"))
+        size = int(header.get("size", -1))
+        if size < 0:
+            raise ValueError("帧头缺少 size")
+
+        count += 1
+        if count > max_frames:
+            raise ValueError(f"单次最多 {max_frames} 个分片")
+        payload = FramePayload(stream, size)
+        yield header, payload
+        payload.drain()
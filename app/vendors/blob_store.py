@@ -0,0 +1,53 @@
+import errno
+import hashlib
+import math
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import List, Optional, Tuple
+from app.vendors.settings import Settings
+from app.vendors.storage import ensure_parent
+
+# 内容寻址布局：<root>/blobs/ab/cd/abcdef...（按 sha256 前两级分桶，避免单目录过大）
+# root 由 pick_root 在 Settings.STORAGE_ROOTS 中按加权最高随机权重（rendezvous hashing）选出：
+# 同一内容总落在同一块盘；增删根目录时只有约 1/N 的内容需要迁移。读取一律走数据库里记录的 storage_path。
+BLOB_DIR_NAME = "blobs"
+
+def _score(root: Path, weight: float, sha256_hex: str) -> float:
+    digest = hashlib.sha256(f"{root}\0{sha256_hex}".encode("utf-8")).digest()
+    u = (int.from_bytes(digest[:8], "big") + 0.5) / 2 ** 64  # (0, 1)
+    return -weight / math.log(u)
+
+def pick_root(sha256_hex: str, roots: Optional[List[Tuple[Path, float]]] = None) -> Path:
+    roots = roots or Settings.STORAGE_ROOTS
+    return max(roots, key=lambda rw: _score(rw[0], rw[1], sha256_hex))[0]
+
+def blob_path(sha256_hex: str, root: Optional[Path] = None) -> Path:
+    sha256_hex = sha256_hex.lower()
+    base = (root or pick_root(sha256_hex)) / BLOB_DIR_NAME
+    return base / sha256_hex[:2] / sha256_hex[2:4] / sha256_hex
+
+def copy_blob(src: Path, dst: Path) -> None:
+    """跨盘复制：先写同目录临时文件再原子替换，读者不会看到半个文件"""
+    ensure_parent(dst)
+    tmp = dst.with_name(f"{dst.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+def place_blob(src: Path, dst: Path) -> None:
+    """
+    把临时文件原子地放到 blob 位置。同一内容并发放置时后到者直接覆盖，内容相同无副作用。
+    临时目录与目标根目录不在同一块盘时退化为复制后删除。
+    """
+    ensure_parent(dst)
+    try:
+        src.replace(dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        copy_blob(src, dst)
+        src.unlink(missing_ok=True)
@@ -0,0 +1,79 @@
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List
+
+from app.vendors.settings import Settings
+
+class BufferPool:
+    """
+    预分配、可复用的 bytearray 池，配合 readinto/memoryview 使用，热循环里不再每次分配新的 bytes。
+    池空且已达上限时临时分配一个不入池的缓冲（计入 overflow），不阻塞调用方。
+    """
+
+    def __init__(self, buffer_size: int, max_buffers: int) -> None:
+        self.buffer_size = buffer_size
+        self.max_buffers = max_buffers
+        self._free: List[bytearray] = []
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._peak = 0
+        self._acquired = 0
+        self._reused = 0
+        self._overflow = 0
+
+    def _acquire(self) -> bytearray:
+        with self._lock:
+            self._acquired += 1
+            self._in_use += 1
+            self._peak = max(self._peak, self._in_use)
+            if self._free:
+                self._reused += 1
+                return self._free.pop()
+            if self._created < self.max_buffers:
+                self._created += 1
+            else:
+                self._overflow += 1
+        return bytearray(self.buffer_size)
+
+    def _release(self, buf: bytearray) -> None:
+        with self._lock:
+            self._in_use -= 1
+            if len(self._free) + self._in_use < self.max_buffers:
+                self._free.append(buf)
+
+    @contextmanager
+    def buffer(self) -> Iterator[memoryview]:
+        buf = self._acquire()
+        view = memoryview(buf)
+        try:
+            yield view
+        finally:
+            view.release()
+            self._release(buf)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "buffer_size": self.buffer_size,
+                "max_buffers": self.max_buffers,
+                "allocated": self._created,
+                "free": len(self._free),
+                "in_use": self._in_use,
+                "peak_in_use": self._peak,
+                "acquired": self._acquired,
+                "reused": self._reused,
+                "overflow": self._overflow,
+            }
+
+def readinto(stream, view: memoryview) -> int:
+    """优先 stream.readinto；不支持的流退回 read 后拷入"""
+    reader = getattr(stream, "readinto", None)
+    if reader is not None:
+        n = reader(view)
+        return n or 0
+    data = stream.read(len(view))
+    view[:len(data)] = data
+    return len(data)
+
+pool = BufferPool(Settings.BUFFER_SIZE, Settings.BUFFER_POOL_MAX)
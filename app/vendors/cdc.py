@@ -0,0 +1,157 @@
+import hashlib
+import io
+import mmap
+import os
+import uuid
+from bisect import bisect_right
+from pathlib import Path
+from typing import Iterator, Optional, Sequence, Tuple
+
+from app.vendors.blob_store import pick_root
+from app.vendors.settings import Settings
+from app.vendors.storage import ensure_parent
+
+# 内容定义分块（gear 滚动哈希，FastCDC 的做法）：
+#   h = (h << 1) + GEAR[byte]，取 64 位；h 的高 bits 位全为 0 处切分，相当于只看最近 64 字节的内容，
+#   在文件中间插入/删除数据只影响附近一两个分块，其余分块的 sha256 不变，可以跨版本共享。
+#   每块先跳过 min_size 字节不计算哈希，到 max_size 强制切分；期望块长约为 min_size + 2 ** bits。
+# 分块布局：<root>/chunks/ab/cd/abcdef...，root 与 Blob 一样按 sha256 由 pick_root 选出。
+# 客户端可以用任意切分方式上传分块，服务端只按 sha256 认分块；按本模块的参数切分才能与服务端转存的分块共享。
+CHUNK_DIR_NAME = "chunks"
+
+GEAR = tuple(int.from_bytes(hashlib.sha256(bytes([i])).digest()[:8], "big") for i in range(256))
+_MASK64 = (1 << 64) - 1
+
+Segment = Tuple[str, int]  # (分块路径, 大小)
+
+def _cut_mask(min_size: int, avg_size: int) -> int:
+    bits = max((avg_size - min_size).bit_length() - 1, 1)
+    return ((1 << bits) - 1) << (64 - bits)
+
+def _next_cut(data, pos: int, end: int, min_size: int, mask: int) -> int:
+    start = pos + min_size
+    if start >= end:
+        return end
+    gear, h, i = GEAR, 0, start
+    for b in data[start:end]:
+        h = ((h << 1) + gear[b]) & _MASK64
+        i += 1
+        if not h & mask:
+            return i
+    return end
+
+def iter_chunks(
+    path: Path,
+    min_size: Optional[int] = None,
+    avg_size: Optional[int] = None,
+    max_size: Optional[int] = None,
+) -> Iterator[Tuple[int, bytes]]:
+    """按内容切分文件，逐块产出 (偏移, 数据)；文件经 mmap 读取，内存只占当前一块"""
+    min_size = min_size or Settings.CDC_MIN_CHUNK
+    max_size = max_size or Settings.CDC_MAX_CHUNK
+    mask = _cut_mask(min_size, avg_size or Settings.CDC_AVG_CHUNK)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = 0
+            while pos < size:
+                cut = _next_cut(mm, pos, min(pos + max_size, size), min_size, mask)
+                yield pos, mm[pos:cut]
+                pos = cut
+
+def chunk_path(sha256_hex: str, root: Optional[Path] = None) -> Path:
+    sha256_hex = sha256_hex.lower()
+    base = (root or pick_root(sha256_hex)) / CHUNK_DIR_NAME
+    return base / sha256_hex[:2] / sha256_hex[2:4] / sha256_hex
+
+def write_chunk(data: bytes, dst: Path) -> None:
+    """先写同目录临时文件再原子替换；同一分块并发写入时内容相同，后到者覆盖无副作用"""
+    ensure_parent(dst)
+    tmp = dst.with_name(f"{dst.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with tmp.open("wb") as f:
+            f.write(data)
+        os.replace(tmp, dst)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+def _select(segments: Sequence[Segment], start: int, length: int):
+    pos = 0
+    for path, size in segments:
+        lo, hi = max(start, pos), min(start + length, pos + size)
+        if lo < hi:
+            yield path, lo - pos, hi - lo
+        pos += size
+        if pos >= start + length:
+            break
+
+def read_segments(segments: Sequence[Segment], start: int, length: int, block_size: int) -> Iterator[bytes]:
+    """
+    按序读出分块拼接后 [start, start+length) 的字节。
+    先确认涉及的分块都在再返回生成器：缺失在构造响应时就抛 FileNotFoundError，而不是发到一半才失败。
+    """
+    parts = list(_select(segments, start, length))
+    for path, _, _ in parts:
+        os.stat(path)
+    return _read_parts(parts, block_size)
+
+def _read_parts(parts, block_size: int) -> Iterator[bytes]:
+    for path, offset, remaining in parts:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            while remaining > 0:
+                data = os.pread(fd, min(block_size, remaining), offset)
+                if not data:
+                    raise ValueError(f"分块 {path} 比记录的大小短")
+                offset += len(data)
+                remaining -= len(data)
+                yield data
+        finally:
+            os.close(fd)
+
+class SegmentReader(io.RawIOBase):
+    """把分块清单包装成可 seek 的只读文件对象，供 Pillow 等需要随机读的场景使用"""
+
+    def __init__(self, segments: Sequence[Segment]) -> None:
+        super().__init__()
+        self._segments = list(segments)
+        self._starts, pos = [], 0
+        for _, size in self._segments:
+            self._starts.append(pos)
+            pos += size
+        self._size, self._pos = pos, 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self._size}[whence]
+        self._pos = max(base + offset, 0)
+        return self._pos
+
+    def readinto(self, b) -> int:
+        if self._pos >= self._size:
+            return 0
+        i = bisect_right(self._starts, self._pos) - 1
+        path, size = self._segments[i]
+        offset = self._pos - self._starts[i]
+        view = memoryview(b)[:size - offset]
+        with open(path, "rb") as f:
+            f.seek(offset)
+            n = f.readinto(view)
+        if not n:
+            raise ValueError(f"分块 {path} 比记录的大小短")
+        self._pos += n
+        return n
+
+def open_segments(segments: Sequence[Segment]) -> io.BufferedReader:
+    # 带缓冲：read(n) 跨分块时也会读满 n 字节
+    return io.BufferedReader(SegmentReader(segments), buffer_size=Settings.BUFFER_SIZE)
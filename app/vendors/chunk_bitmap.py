@@ -0,0 +1,71 @@
+from typing import List, Optional, Tuple
+
+# 分片接收位图：第 i 个分片对应第 i 个 bit（低位在前），按字节存储在 ResumableUpload.received_bitmap
+
+# received_bitmap 为 LargeBinary，MySQL 上是 BLOB，最多 65535 字节；一个会话的分片数不能超过 MAX_CHUNKS
+MAX_BYTES = 65535
+MAX_CHUNKS = MAX_BYTES * 8
+
+def has_bit(bitmap: Optional[bytes], index: int) -> bool:
+    if not bitmap:
+        return False
+    byte_index = index >> 3
+    if byte_index >= len(bitmap):
+        return False
+    return bool(bitmap[byte_index] & (1 << (index & 7)))
+
+def set_bit(bitmap: Optional[bytes], index: int) -> bytes:
+    buf = bytearray(bitmap or b"")
+    byte_index = index >> 3
+    if byte_index >= len(buf):
+        buf.extend(b"\x00" * (byte_index + 1 - len(buf)))
+    buf[byte_index] |= 1 << (index & 7)
+    return bytes(buf)
+
+def count_bits(bitmap: Optional[bytes]) -> int:
+    return sum(bin(b).count("1") for b in (bitmap or b""))
+
+def highest_bit(bitmap: Optional[bytes]) -> int:
+    """返回已置位的最大下标，没有则返回 -1"""
+    buf = bitmap or b""
+    for byte_index in range(len(buf) - 1, -1, -1):
+        b = buf[byte_index]
+        if b:
+            return (byte_index << 3) + b.bit_length() - 1
+    return -1
+
+def first_missing(bitmap: Optional[bytes]) -> int:
+    buf = bitmap or b""
+    for byte_index, b in enumerate(buf):
+        if b != 0xFF:
+            inverted = ~b & 0xFF
+            return (byte_index << 3) + (inverted & -inverted).bit_length() - 1
+    return len(buf) << 3
+
+def missing_indexes(bitmap: Optional[bytes], total: int, limit: Optional[int] = None) -> List[int]:
+    missing = []
+    for i in range(total):
+        if not has_bit(bitmap, i):
+            missing.append(i)
+            if limit is not None and len(missing) >= limit:
+                break
+    return missing
+
+def ranges(bitmap: Optional[bytes]) -> List[Tuple[int, int]]:
+    """已置位的连续区间 [(start, end_exclusive)]，全 0/全 1 字节整体跳过"""
+    result = []
+    start = None
+    for byte_index, b in enumerate(bitmap or b""):
+        if b in (0, 0xFF) and (start is None) == (b == 0):
+            continue
+        for bit in range(8):
+            i = (byte_index << 3) + bit
+            if b & (1 << bit):
+                if start is None:
+                    start = i
+            elif start is not None:
+                result.append((start, i))
+                start = None
+    if start is not None:
+        result.append((start, len(bitmap) << 3))
+    return result
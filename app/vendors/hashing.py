@@ -0,0 +1,78 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional
+from app.vendors.buffer_pool import pool
+
+class ProgressiveHasher:
+    """
+    沿着“已连续到达”的前缀增量计算整文件 sha256。
+    刚写入的分片通常还在页缓存里，追读成本很低；提交时只需补齐剩余尾部。
+    """
+
+    def __init__(self) -> None:
+        self._h = hashlib.sha256()
+        self.offset = 0
+        self.lock = threading.Lock()
+
+    def catch_up(self, path: Path, end: int) -> None:
+        # 调用方需持有 self.lock
+        if end <= self.offset:
+            return
+        with pool.buffer() as buf, path.open("rb", buffering=0) as f:
+            f.seek(self.offset)
+            remaining = end - self.offset
+            while remaining > 0:
+                n = f.readinto(buf[:min(len(buf), remaining)])
+                if not n:
+                    raise ValueError("Temporary file shorter than received chunks")
+                self._h.update(buf[:n])
+                self.offset += n
+                remaining -= n
+
+    def hexdigest(self) -> str:
+        return self._h.hexdigest()
+
+class HasherRegistry:
+    """进程内 upload_id -> ProgressiveHasher，超出上限按 LRU 淘汰（淘汰后提交时回退为整文件重读）"""
+
+    def __init__(self, max_entries: int) -> None:
+        self._items: "OrderedDict[str, ProgressiveHasher]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+
+    def get(self, upload_id: str, create: bool = False) -> Optional[ProgressiveHasher]:
+        with self._lock:
+            hasher = self._items.get(upload_id)
+            if hasher is not None:
+                self._items.move_to_end(upload_id)
+                return hasher
+            if not create:
+                return None
+            hasher = ProgressiveHasher()
+            self._items[upload_id] = hasher
+            while len(self._items) > self._max_entries:
+                self._items.popitem(last=False)
+            return hasher
+
+    def discard(self, upload_id: str) -> None:
+        with self._lock:
+            self._items.pop(upload_id, None)
+
+def merkle_root(leaf_hexes: List[str]) -> str:
+    """
+    分片 sha256 的二叉 Merkle 根：相邻两两拼接后 sha256，奇数个时末尾节点直接上提。
+    没有分片时返回空内容的 sha256。
+    """
+    if not leaf_hexes:
+        return hashlib.sha256(b"").hexdigest()
+    level = [bytes.fromhex(h) for h in leaf_hexes]
+    while len(level) > 1:
+        nxt = []
+        for i in range(0, len(level) - 1, 2):
+            nxt.append(hashlib.sha256(level[i] + level[i + 1]).digest())
+        if len(level) % 2:
+            nxt.append(level[-1])
+        level = nxt
+    return level[0].hex()
@@ -0,0 +1,214 @@
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Mapping, Optional, Union
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow 为可选依赖，未安装时派生图功能不可用
+    Image = None
+    ImageOps = None
+
+from app.vendors.storage import ensure_parent
+
+FITS = ("inside", "contain", "cover", "fill")
+FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+    "webp": ("WEBP", "image/webp"),
+}
+PARAM_NAMES = ("width", "height", "fit", "format", "quality")
+DEFAULT_QUALITY = 82
+
+@dataclass(frozen=True)
+class DerivativeParams:
+    width: Optional[int]
+    height: Optional[int]
+    fit: str
+    fmt: str
+    quality: int
+
+    @property
+    def mimetype(self) -> str:
+        return FORMATS[self.fmt][1]
+
+    @property
+    def tag(self) -> str:
+        return f"{self.width or 0}x{self.height or 0}_{self.fit}_q{self.quality}.{self.fmt}"
+
+    def key(self, sha256_hex: str) -> str:
+        return f"{sha256_hex}_{self.tag}"
+
+def available() -> bool:
+    return Image is not None
+
+def wants_derivative(args: Mapping[str, str]) -> bool:
+    return any(name in args for name in PARAM_NAMES)
+
+def _int_arg(args: Mapping[str, str], name: str, low: int, high: int) -> Optional[int]:
+    raw = args.get(name)
+    if raw in (None, ""):
+        return None
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ValueError(f"{name} 必须是整数")
+    if not low <= value <= high:
+        raise ValueError(f"{name} 取值范围 {low}-{high}")
+    return value
+
+def parse_params(args: Mapping[str, str], source_content_type: Optional[str], max_dimension: int) -> DerivativeParams:
+    width = _int_arg(args, "width", 1, max_dimension)
+    height = _int_arg(args, "height", 1, max_dimension)
+    quality = _int_arg(args, "quality", 1, 100) or DEFAULT_QUALITY
+
+    fit = (args.get("fit") or "inside").lower()
+    if fit not in FITS:
+        raise ValueError(f"fit 只能是 {', '.join(FITS)}")
+
+    fmt = (args.get("format") or "").lower().replace("jpg", "jpeg")
+    if not fmt:
+        # 未指定格式时沿用原图格式，无法输出的格式回退为 png
+        src = (source_content_type or "").split("/")[-1].lower()
+        fmt = src if src in FORMATS else "png"
+    if fmt not in FORMATS:
+        raise ValueError(f"format 只能是 {', '.join(FORMATS)}")
+    if fmt == "png":
+        quality = DEFAULT_QUALITY  # png 无损，不让 quality 产生重复缓存键
+    if not (width and height):
+        fit = "inside"  # fit 只在同时给出宽高时生效，同理不让它产生重复缓存键
+    return DerivativeParams(width, height, fit, fmt, quality)
+
+def _render(source: Union[Path, BinaryIO], dst: Path, params: DerivativeParams) -> None:
+    with Image.open(source) as im:
+        im = ImageOps.exif_transpose(im)
+        w, h = params.width, params.height
+        if w and h:
+            if params.fit == "cover":
+                im = ImageOps.fit(im, (w, h), Image.LANCZOS)
+            elif params.fit == "contain":
+                im = ImageOps.contain(im, (w, h), Image.LANCZOS)
+            elif params.fit == "fill":
+                im = im.resize((w, h), Image.LANCZOS)
+            else:
+                im.thumbnail((w, h), Image.LANCZOS)
+        elif w or h:
+            # 只给一边时按比例缩放，不放大
+            ratio = (w / im.width) if w else (h / im.height)
+            if ratio < 1:
+                im = im.resize((max(1, round(im.width * ratio)), max(1, round(im.height * ratio))), Image.LANCZOS)
+
+        pil_format = FORMATS[params.fmt][0]
+        if pil_format == "JPEG" and im.mode not in ("RGB", "L"):
+            im = im.convert("RGB")
+        save_kwargs = {"optimize": True}
+        if pil_format in ("JPEG", "WEBP"):
+            save_kwargs["quality"] = params.quality
+        im.save(dst, format=pil_format, **save_kwargs)
+
+class DerivativeCache:
+    """
+    派生图磁盘缓存：按 sha256+参数 命名，总大小超过 max_bytes 时按最久未用淘汰；
+    同一派生图的并发请求只渲染一次，其余请求等待结果。
+    """
+
+    def __init__(self, root: Path, max_bytes: int) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index: Optional["OrderedDict[Path, int]"] = None
+        self._total = 0
+        self._inflight: Dict[str, threading.Lock] = {}
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def _load_index(self) -> None:
+        # 首次使用时扫描一次目录，按 mtime 近似恢复使用顺序；调用方需持有 self._lock
+        if self._index is not None:
+            return
+        entries = []
+        if self.root.exists():
+            for p in self.root.glob("*/*"):
+                if p.name.endswith(".tmp"):
+                    continue
+                try:
+                    st = p.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, p, st.st_size))
+        entries.sort()
+        self._index = OrderedDict((p, size) for _, p, size in entries)
+        self._total = sum(size for _, _, size in entries)
+
+    def _touch(self, path: Path) -> bool:
+        with self._lock:
+            self._load_index()
+            if path in self._index:
+                self._index.move_to_end(path)
+                return True
+            return False
+
+    def _add(self, path: Path, size: int) -> None:
+        with self._lock:
+            self._load_index()
+            self._total += size - self._index.pop(path, 0)
+            self._index[path] = size
+            while self._total > self.max_bytes and len(self._index) > 1:
+                victim, victim_size = self._index.popitem(last=False)
+                self._total -= victim_size
+                try:
+                    victim.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def get_or_create(self, sha256_hex: str, params: DerivativeParams, open_source: Callable[[], Union[Path, BinaryIO]]) -> Path:
+        # open_source 返回原图路径，或打包/分块存储时的文件对象；只在缓存未命中、需要渲染时才调用
+        if not available():
+            raise RuntimeError("服务器未安装 Pillow，无法生成派生图")
+        key = params.key(sha256_hex)
+        path = self._path(key)
+        if self._touch(path) and path.exists():
+            return path
+
+        with self._lock:
+            gate = self._inflight.setdefault(key, threading.Lock())
+        with gate:
+            try:
+                if path.exists():
+                    self._add(path, path.stat().st_size)
+                    return path
+                ensure_parent(path)
+                tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+                source = open_source()
+                try:
+                    _render(source, tmp, params)
+                    os.replace(tmp, path)
+                finally:
+                    tmp.unlink(missing_ok=True)
+                    if not isinstance(source, Path):
+                        source.close()
+                self._add(path, path.stat().st_size)
+                return path
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+
+    def purge(self, sha256_hex: str) -> int:
+        """删除某个内容的全部派生图（原图被回收时调用），返回释放的字节数"""
+        freed = 0
+        with self._lock:
+            self._load_index()
+            for path in (self.root / sha256_hex[:2]).glob(f"{sha256_hex}_*"):
+                size = self._index.pop(path, None)
+                if size is not None:
+                    self._total -= size
+                try:
+                    freed += path.stat().st_size
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+        return freed
@@ -0,0 +1,88 @@
+import os
+import re
+import shutil
+from pathlib import Path
+from typing import BinaryIO, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # 非 POSIX 平台没有 flock，小文件打包不可用
+    fcntl = None
+
+from app.vendors.settings import Settings
+
+# 小文件打包：不超过 PACK_THRESHOLD 的 Blob 追加写进 <root>/packs/pack-000001.dat，
+# Blob 行记录 (storage_path=包文件, pack_offset)；包写满 PACK_MAX_BYTES 后换下一个。
+# 追加在目录锁（flock）内进行，多进程/多线程安全；事务回滚留下的无主字节由 compact 回收。
+PACK_DIR_NAME = "packs"
+PACK_NAME_RE = re.compile(r"^pack-(\d{6})\.dat$")
+
+def available() -> bool:
+    return fcntl is not None
+
+def should_pack(size: int) -> bool:
+    return Settings.PACK_ENABLED and available() and size <= Settings.PACK_THRESHOLD
+
+def pack_dir(root: Path) -> Path:
+    return root / PACK_DIR_NAME
+
+def pack_files(root: Path) -> list:
+    """按序号升序返回某个根目录下的全部包文件"""
+    d = pack_dir(root)
+    if not d.exists():
+        return []
+    return sorted(p for p in d.iterdir() if PACK_NAME_RE.match(p.name))
+
+class _DirLock:
+    def __init__(self, root: Path) -> None:
+        d = pack_dir(root)
+        d.mkdir(parents=True, exist_ok=True)
+        self._path = d / ".lock"
+        self._fd: Optional[int] = None
+
+    def __enter__(self):
+        self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+
+def _active_pack(root: Path, incoming: int) -> Path:
+    # 调用方需持有目录锁
+    packs = pack_files(root)
+    if packs:
+        last = packs[-1]
+        if last.stat().st_size + incoming <= Settings.PACK_MAX_BYTES:
+            return last
+        seq = int(PACK_NAME_RE.match(last.name).group(1)) + 1
+    else:
+        seq = 1
+    return pack_dir(root) / f"pack-{seq:06d}.dat"
+
+def append(root: Path, src: BinaryIO, size: int) -> Tuple[Path, int]:
+    """把 src 的 size 字节追加到 root 下的当前包，返回 (包路径, 偏移)"""
+    with _DirLock(root):
+        path = _active_pack(root, size)
+        with open(path, "ab") as dst:
+            offset = dst.tell()
+            shutil.copyfileobj(src, dst, Settings.CHUNK_SIZE)
+            if dst.tell() - offset != size:
+                # 写短了就截回去，不留半个对象
+                dst.truncate(offset)
+                raise ValueError("Packed object size mismatch")
+            dst.flush()
+            os.fsync(dst.fileno())
+    return path, offset
+
+def read(path: Path, offset: int, size: int) -> bytes:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return os.pread(fd, size, offset)
+    finally:
+        os.close(fd)
+
+def sealed_packs(root: Path) -> list:
+    """已写满、不会再追加的包：除序号最大的当前包以外的全部"""
+    return pack_files(root)[:-1]
@@ -0,0 +1,112 @@
+import gzip
+from pathlib import Path
+from typing import Dict, Optional
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，未安装时只生成 gzip
+    brotli = None
+
+from app.vendors.settings import Settings
+
+# 编码名 -> 变体文件后缀，按服务端偏好排序
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/javascript",
+    "application/x-javascript",
+    "application/xml",
+    "application/wasm",
+    "image/svg+xml",
+}
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    ct = (content_type or "").split(";")[0].strip().lower()
+    return (
+        ct.startswith("text/")
+        or ct in COMPRESSIBLE_TYPES
+        or ct.endswith("+json")
+        or ct.endswith("+xml")
+    )
+
+def variant_path(path: Path, encoding: str) -> Path:
+    return path.with_name(path.name + ENCODING_SUFFIXES[encoding])
+
+class _GzipSink:
+    def __init__(self, f) -> None:
+        self._gz = gzip.GzipFile(fileobj=f, mode="wb", compresslevel=Settings.PRECOMPRESS_GZIP_LEVEL, mtime=0)
+
+    def write(self, data: bytes) -> None:
+        self._gz.write(data)
+
+    def close(self) -> None:
+        self._gz.close()
+
+class _BrotliSink:
+    def __init__(self, f) -> None:
+        self._f = f
+        self._c = brotli.Compressor(quality=Settings.PRECOMPRESS_BROTLI_QUALITY)
+
+    def write(self, data: bytes) -> None:
+        self._f.write(self._c.process(data))
+
+    def close(self) -> None:
+        self._f.write(self._c.finish())
+
+_SINKS = {"br": _BrotliSink, "gzip": _GzipSink}
+
+def build_variants(path: Path, size: int, content_type: Optional[str]) -> Dict[str, int]:
+    """
+    为可压缩的 blob 生成 .br / .gz 变体，只保留明显更小的，返回 {编码: 变体大小}。
+    按 BUFFER_SIZE 分块读一遍原文件、同时喂给各编码器，内存占用与文件大小无关。
+    """
+    if not is_compressible(content_type):
+        return {}
+    if size < Settings.PRECOMPRESS_MIN_SIZE or size > Settings.PRECOMPRESS_MAX_SIZE:
+        return {}
+    encodings = [e for e in ENCODING_SUFFIXES if e != "br" or brotli is not None]
+    tmps = {e: path.with_name(path.name + ENCODING_SUFFIXES[e] + ".tmp") for e in encodings}
+    files = {e: tmp.open("wb") for e, tmp in tmps.items()}
+    try:
+        sinks = {e: _SINKS[e](f) for e, f in files.items()}
+        with path.open("rb") as src:
+            while True:
+                data = src.read(Settings.BUFFER_SIZE)
+                if not data:
+                    break
+                for sink in sinks.values():
+                    sink.write(data)
+        for sink in sinks.values():
+            sink.close()
+    except BaseException:
+        for tmp in tmps.values():
+            tmp.unlink(missing_ok=True)
+        raise
+    finally:
+        for f in files.values():
+            f.close()
+
+    result = {}
+    for encoding, tmp in tmps.items():
+        packed = tmp.stat().st_size
+        if packed > size * Settings.PRECOMPRESS_MAX_RATIO:
+            tmp.unlink(missing_ok=True)
+            continue
+        tmp.replace(variant_path(path, encoding))
+        result[encoding] = packed
+    return result
+
+def format_encodings(variants: Dict[str, int]) -> Optional[str]:
+    # 存成 "br:123,gzip:456"，带上大小以便发送时不用 stat
+    if not variants:
+        return None
+    return ",".join(f"{enc}:{size}" for enc, size in variants.items())
+
+def parse_encodings(raw: Optional[str]) -> Dict[str, int]:
+    result = {}
+    for item in (raw or "").split(","):
+        if ":" in item:
+            enc, size = item.split(":", 1)
+            result[enc] = int(size)
+    return result
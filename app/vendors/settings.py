@@ -1,22 +1,109 @@
 import os
 from pathlib import Path
 
-class Settings:
-    DB_USER = os.getenv("DB_USER", "root")
-    DB_PASSWORD = os.getenv("DB_PASSWORD", "zhangenjian123..")
-    DB_HOST = os.getenv("DB_HOST", "127.0.0.1")
-    DB_PORT = os.getenv("DB_PORT", "3307")
-    DB_NAME = os.getenv("DB_NAME", "shuke")
+def _parse_storage_roots(raw: str, default: Path):
+    """STORAGE_ROOTS="/mnt/nvme0/files=2,/mnt/nvme1/files"：逗号分隔，=后为权重（默认 1）"""
+    roots = []
+    for item in raw.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        path, _, weight = item.rpartition("=") if "=" in item else (item, "", "1")
+        roots.append((Path(path).resolve(), float(weight)))
+    return roots or [(default, 1.0)]
 
-    SQLALCHEMY_DATABASE_URI = os.getenv(
-        "DATABASE_URL",
-        f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4",
-    )
+class Settings:
+    # 数据库连接串与连接池参数只在 database.py 配置（DATABASE_URL 或 DB_*，不提供默认口令），由 config.load_config 读取
+    DB_REPLICA_RETRY = float(os.getenv("DB_REPLICA_RETRY", "30"))  # 从库连接出错后暂停使用的秒数，见 app.models.routing
 
     STORAGE_DIR = Path(os.getenv("STORAGE_DIR", "./storage")).resolve()
     TMP_DIR = Path(os.getenv("TMP_DIR", "./tmp")).resolve()
+    # Blob 按 sha256 加权分散到多个存储根目录（通常每块盘一个），未配置时只用 STORAGE_DIR
+    STORAGE_ROOTS = _parse_storage_roots(os.getenv("STORAGE_ROOTS", ""), STORAGE_DIR)
     CHUNK_SIZE = 1024 * 1024 * 8  # 8MB
+    # 客户端自定分片大小的范围：过小时位图装不下（见 app.vendors.chunk_bitmap.MAX_CHUNKS），上限不超过 Integer 列
+    MIN_CHUNK_SIZE = int(os.getenv("MIN_CHUNK_SIZE", str(64 * 1024)))
+    MAX_CHUNK_SIZE = min(int(os.getenv("MAX_CHUNK_SIZE", str(64 * 1024 * 1024))), 2 ** 31 - 1)
+    # 上传/哈希热循环的复用缓冲池，见 app.vendors.buffer_pool
+    BUFFER_SIZE = int(os.getenv("BUFFER_SIZE", str(1024 * 1024)))
+    BUFFER_POOL_MAX = int(os.getenv("BUFFER_POOL_MAX", "64"))
+    # 进程内最多同时跟踪多少个分片会话的增量整文件哈希
+    HASHER_REGISTRY_MAX = int(os.getenv("HASHER_REGISTRY_MAX", "1024"))
+    BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "256"))  # 批量创建/分片/提交单次最多条数
+    ARCHIVE_MAX_FILES = int(os.getenv("ARCHIVE_MAX_FILES", "10000"))  # 打包下载单次最多文件数
+
+    # 下载卸载给前端代理："" 不卸载 / "x-accel-redirect"（nginx internal location）/ "x-sendfile"（Apache、lighttpd）
+    SENDFILE_BACKEND = os.getenv("SENDFILE_BACKEND", "").lower()
+    # STORAGE_DIR 对应该前缀；STORAGE_ROOTS 中第 i 个根目录（从 0 起）对应 "<前缀>-<i>"
+    ACCEL_REDIRECT_PREFIX = os.getenv("ACCEL_REDIRECT_PREFIX", "/_protected_storage")
+    # WSGI 服务器的 file_wrapper 是否按 Content-Length 截断（gunicorn 是），是则中间段 Range 也走 sendfile
+    FILE_WRAPPER_HONORS_LENGTH = os.getenv("FILE_WRAPPER_HONORS_LENGTH", "0") == "1"
+    MAX_RANGES = int(os.getenv("MAX_RANGES", "16"))  # 超过则忽略 Range 返回整文件
+
+    # 下载/直链的文件元数据进程内缓存（按 public_name 与 id 两个键），0 表示关闭
+    META_CACHE_SIZE = int(os.getenv("META_CACHE_SIZE", "10000"))
+    META_CACHE_TTL = float(os.getenv("META_CACHE_TTL", "60"))
+
+    # 图片派生（缩放/转码）磁盘缓存，需安装 Pillow
+    DERIVATIVE_DIR = Path(os.getenv("DERIVATIVE_DIR", str(STORAGE_DIR / "derivatives"))).resolve()
+    DERIVATIVE_CACHE_MAX_BYTES = int(os.getenv("DERIVATIVE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+    IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "4096"))
+
+    # 文本类资源预压缩（gzip，装了 brotli 再加 br），下载时按 Accept-Encoding 选择。
+    # 入库事务里不压缩：后台 precompress-blobs 任务每 PRECOMPRESS_INTERVAL 秒为新内容补建变体
+    PRECOMPRESS_ENABLED = os.getenv("PRECOMPRESS_ENABLED", "1") == "1"
+    PRECOMPRESS_MIN_SIZE = int(os.getenv("PRECOMPRESS_MIN_SIZE", "1024"))
+    PRECOMPRESS_MAX_SIZE = int(os.getenv("PRECOMPRESS_MAX_SIZE", str(64 * 1024 * 1024)))
+    PRECOMPRESS_MAX_RATIO = float(os.getenv("PRECOMPRESS_MAX_RATIO", "0.9"))  # 压缩后不小于原大小的该比例就不保留
+    PRECOMPRESS_GZIP_LEVEL = int(os.getenv("PRECOMPRESS_GZIP_LEVEL", "6"))
+    PRECOMPRESS_BROTLI_QUALITY = int(os.getenv("PRECOMPRESS_BROTLI_QUALITY", "5"))
+    PRECOMPRESS_INTERVAL = float(os.getenv("PRECOMPRESS_INTERVAL", "30"))
+    PRECOMPRESS_BATCH_SIZE = int(os.getenv("PRECOMPRESS_BATCH_SIZE", "100"))
+
+    # 小文件打包存储（需 POSIX flock）：不超过阈值的内容追加进大包文件，减少 inode 与 open/stat 开销
+    PACK_ENABLED = os.getenv("PACK_ENABLED", "0") == "1"
+    PACK_THRESHOLD = int(os.getenv("PACK_THRESHOLD", str(64 * 1024)))
+    PACK_MAX_BYTES = int(os.getenv("PACK_MAX_BYTES", str(1024 * 1024 * 1024)))
+    PACK_COMPACT_RATIO = float(os.getenv("PACK_COMPACT_RATIO", "0.5"))  # 有效数据占比低于该值的包才压缩
+    PACK_COMPACT_INTERVAL = float(os.getenv("PACK_COMPACT_INTERVAL", str(24 * 3600)))
+
+    # 内容定义分块去重（CDC）：大文件按滚动哈希切成变长分块，同一文件的不同版本共享未变化的分块。
+    # 开启后后台把不小于 CDC_MIN_FILE_SIZE 的整文件 Blob 转为分块存储；客户端也可先查询缺失分块只传新分块
+    CDC_ENABLED = os.getenv("CDC_ENABLED", "0") == "1"
+    CDC_MIN_FILE_SIZE = int(os.getenv("CDC_MIN_FILE_SIZE", str(16 * 1024 * 1024)))
+    CDC_MIN_CHUNK = int(os.getenv("CDC_MIN_CHUNK", str(256 * 1024)))
+    CDC_AVG_CHUNK = int(os.getenv("CDC_AVG_CHUNK", str(1024 * 1024)))
+    CDC_MAX_CHUNK = int(os.getenv("CDC_MAX_CHUNK", str(4 * 1024 * 1024)))
+    CDC_UPLOAD_MAX_CHUNK = int(os.getenv("CDC_UPLOAD_MAX_CHUNK", str(16 * 1024 * 1024)))  # 客户端上传的单个分块上限
+    CDC_COMMIT_MAX_CHUNKS = int(os.getenv("CDC_COMMIT_MAX_CHUNKS", "100000"))
+    CDC_INTERVAL = float(os.getenv("CDC_INTERVAL", "3600"))  # 后台转换的读盘限速沿用 SCRUB_IO_BYTES_PER_SEC
+    CDC_BATCH_SIZE = int(os.getenv("CDC_BATCH_SIZE", "20"))
+
+    # 后台任务：run.py 的服务进程在 BACKGROUND_WORKERS=1 时启动；为 0 时改用 flask run-workers 单独运行，
+    # 或由 cron 触发 flask reap-uploads 等单次命令
+    BACKGROUND_WORKERS = os.getenv("BACKGROUND_WORKERS", "1") == "1"
+    UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))  # 会话超过该秒数未活动即回收
+    REAPER_INTERVAL = float(os.getenv("REAPER_INTERVAL", "3600"))
+    REAPER_BATCH_SIZE = int(os.getenv("REAPER_BATCH_SIZE", "200"))
+    REAPER_BATCH_PAUSE = float(os.getenv("REAPER_BATCH_PAUSE", "0.2"))  # 批次之间休眠秒数
+    REAPER_IO_BYTES_PER_SEC = int(os.getenv("REAPER_IO_BYTES_PER_SEC", str(256 * 1024 * 1024)))  # 0 不限速
+    # 已删除文件的物理回收，批次休眠与删除限速沿用上面的 REAPER_* 配置
+    RECLAIM_INTERVAL = float(os.getenv("RECLAIM_INTERVAL", "300"))
+    RECLAIM_BATCH_SIZE = int(os.getenv("RECLAIM_BATCH_SIZE", "200"))
+    # 后台完整性巡检：按限速重读 Blob 校验大小与 sha256
+    SCRUB_INTERVAL = float(os.getenv("SCRUB_INTERVAL", "3600"))
+    SCRUB_BATCH_SIZE = int(os.getenv("SCRUB_BATCH_SIZE", "100"))
+    SCRUB_IO_BYTES_PER_SEC = int(os.getenv("SCRUB_IO_BYTES_PER_SEC", str(32 * 1024 * 1024)))
+    SCRUB_REVERIFY_AFTER = int(os.getenv("SCRUB_REVERIFY_AFTER", str(7 * 24 * 3600)))  # 同一 Blob 两次巡检的最小间隔秒数
+    # 异步提交工作池（POST /uploads/<id>/commit?async=1）
+    COMMIT_WORKERS = int(os.getenv("COMMIT_WORKERS", "4"))
+    COMMIT_PER_DISK = int(os.getenv("COMMIT_PER_DISK", "2"))  # 同一块盘上同时执行的提交任务数
+    COMMIT_POLL_INTERVAL = float(os.getenv("COMMIT_POLL_INTERVAL", "2"))
+    COMMIT_JOB_LEASE = int(os.getenv("COMMIT_JOB_LEASE", "300"))  # running 超过该秒数未续约视为执行进程已退出；每 1/4 租约续约一次
+    COMMIT_JOB_MAX_ATTEMPTS = int(os.getenv("COMMIT_JOB_MAX_ATTEMPTS", "3"))
 
 # 确保目录存在
 Settings.STORAGE_DIR.mkdir(parents=True, exist_ok=True)
+for _root, _weight in Settings.STORAGE_ROOTS:
+    _root.mkdir(parents=True, exist_ok=True)
 Settings.TMP_DIR.mkdir(parents=True, exist_ok=True)
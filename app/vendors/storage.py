@@ -1,9 +1,10 @@
 import hashlib
+import os
 import re
 import uuid
 from pathlib import Path
 from typing import Tuple
-from app.vendors.settings import Settings
+from app.vendors.buffer_pool import pool, readinto
 
 SAFE_NAME_RE = re.compile(r"[^\w\-.·\u4e00-\u9fa5]")
 
@@ -29,10 +30,58 @@ def atomic_move(src: Path, dst: Path) -> None:
 
 def sha256_of_path(path: Path) -> str:
     h = hashlib.sha256()
-    with path.open("rb") as f:
+    # 无缓冲打开，readinto 直接读进池里的缓冲，不经过 BufferedReader 再拷一次
+    with pool.buffer() as buf, path.open("rb", buffering=0) as f:
         while True:
-            chunk = f.read(Settings.CHUNK_SIZE)
-            if not chunk:
+            n = f.readinto(buf)
+            if not n:
                 break
-            h.update(chunk)
+            h.update(buf[:n])
     return h.hexdigest()
+
+def write_stream_at(path: Path, offset: int, stream, limit: int) -> Tuple[int, str]:
+    """
+    把 stream 写入 path 的 offset 处（文件需已存在），最多 limit 字节，返回 (写入字节数, sha256)。
+    超过 limit 时在越界写入之前抛错，避免覆盖相邻分片。
+    """
+    h = hashlib.sha256()
+    written = 0
+    with pool.buffer() as buf, path.open("r+b") as out:
+        out.seek(offset)
+        while True:
+            n = readinto(stream, buf)
+            if not n:
+                break
+            if written + n > limit:
+                raise ValueError(f"Chunk larger than chunk_size {limit}")
+            data = buf[:n]
+            out.write(data)
+            written += n
+            h.update(data)
+    return written, h.hexdigest()
+
+def copy_into(src: Path, dst: Path, offset: int) -> int:
+    """把 src 整个写到 dst 的 offset 处（dst 需已存在），返回字节数；同一文件系统上用 copy_file_range 在内核里拷贝"""
+    with src.open("rb") as fin, dst.open("r+b") as fout:
+        size = os.fstat(fin.fileno()).st_size
+        copied = 0
+        if hasattr(os, "copy_file_range"):
+            try:
+                while copied < size:
+                    n = os.copy_file_range(fin.fileno(), fout.fileno(), size - copied, copied, offset + copied)
+                    if not n:
+                        break
+                    copied += n
+            except OSError:
+                pass  # 跨文件系统等不支持的情况退回普通拷贝
+        if copied < size:
+            fin.seek(copied)
+            fout.seek(offset + copied)
+            with pool.buffer() as buf:
+                while True:
+                    n = fin.readinto(buf)
+                    if not n:
+                        break
+                    fout.write(buf[:n])
+                    copied += n
+    return copied
@@ -0,0 +1,27 @@
+import threading
+import time
+
+class RateLimiter:
+    """
+    令牌桶限速：consume(n) 在超出 rate/秒 时阻塞调用线程，用于后台任务让出磁盘带宽。
+    rate <= 0 表示不限速。
+    """
+
+    def __init__(self, rate: float, burst: float = None) -> None:
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: float) -> None:
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
@@ -0,0 +1,118 @@
+import os
+import zipfile
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from app.vendors.buffer_pool import pool
+from app.vendors.cdc import Segment, read_segments
+
+# 边读边产出 ZIP：zipfile 写入不可 seek 的 sink 时自动使用数据描述符（大小写在数据之后），
+# 每写一块就把 sink 里的字节交给调用方，内存只占一个读缓冲，不落临时文件；超过 4GB 的条目与
+# 超过 65535 个条目时自动使用 Zip64。
+
+# 本身已压缩的格式直接 STORED，避免白白消耗 CPU
+STORED_TYPE_PREFIXES = ("image/", "video/", "audio/")
+STORED_TYPES = {
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-7z-compressed",
+    "application/x-rar-compressed",
+    "application/x-bzip2",
+    "application/x-xz",
+    "application/zstd",
+    "application/pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+}
+UNCOMPRESSED_MEDIA = {"image/svg+xml", "image/bmp", "image/x-ms-bmp", "image/tiff", "audio/wav", "audio/x-wav"}
+
+@dataclass(frozen=True)
+class ArchiveMember:
+    name: str
+    path: Path
+    size: int
+    content_type: Optional[str] = None
+    modified: Optional[datetime] = None
+    offset: Optional[int] = None  # 打包存储时内容在 path 中的偏移
+    segments: Tuple[Segment, ...] = ()  # 分块存储时按序拼接的分块，path 不使用
+
+def is_precompressed(content_type: Optional[str]) -> bool:
+    ct = (content_type or "").split(";")[0].strip().lower()
+    if ct in UNCOMPRESSED_MEDIA:
+        return False
+    return ct in STORED_TYPES or ct.startswith(STORED_TYPE_PREFIXES)
+
+class _Sink:
+    """只追加的输出，没有 tell/seek，zipfile 因此按流式模式写"""
+
+    def __init__(self) -> None:
+        self._parts: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> Iterator[bytes]:
+        if self._parts:
+            out = b"".join(self._parts)
+            self._parts.clear()
+            yield out
+
+def _zip_time(dt: Optional[datetime]):
+    dt = dt or datetime.utcnow()
+    if dt.year < 1980:
+        dt = datetime(1980, 1, 1)
+    return dt.timetuple()[:6]
+
+def _member_blocks(m: ArchiveMember) -> Iterator:
+    # 先打开再返回生成器：缺失的成员在写 ZIP 条目头之前就抛 OSError
+    if m.segments:
+        return read_segments(m.segments, 0, m.size, pool.buffer_size)
+    fd = os.open(m.path, os.O_RDONLY)
+    return _pread_blocks(fd, m)
+
+def _pread_blocks(fd: int, m: ArchiveMember) -> Iterator[memoryview]:
+    try:
+        with pool.buffer() as buf:
+            pos, remaining = m.offset or 0, m.size
+            while remaining > 0:
+                n = os.preadv(fd, [buf[:min(len(buf), remaining)]], pos)
+                if not n:
+                    raise ValueError(f"{m.name} 比记录的大小短")
+                yield buf[:n]
+                pos += n
+                remaining -= n
+    finally:
+        os.close(fd)
+
+def iter_zip(members: Iterable[ArchiveMember], compresslevel: int = 6) -> Iterator[bytes]:
+    """
+    逐块产出 ZIP 字节。打不开的成员（磁盘缺失等）跳过，文件名最后写进 _missing.txt。
+    """
+    sink = _Sink()
+    missing = []
+    with zipfile.ZipFile(sink, "w", allowZip64=True, compresslevel=compresslevel) as zf:
+        for m in members:
+            try:
+                blocks = _member_blocks(m)
+            except OSError:
+                missing.append(m.name)
+                continue
+            zinfo = zipfile.ZipInfo(m.name, date_time=_zip_time(m.modified))
+            zinfo.compress_type = zipfile.ZIP_STORED if is_precompressed(m.content_type) else zipfile.ZIP_DEFLATED
+            zinfo.file_size = m.size
+            with zf.open(zinfo, "w", force_zip64=m.size > zipfile.ZIP64_LIMIT) as dst:
+                for block in blocks:
+                    dst.write(block)
+                    yield from sink.drain()
+            yield from sink.drain()
+        if missing:
+            zf.writestr("_missing.txt", "\n".join(missing) + "\n")
+    yield from sink.drain()
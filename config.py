@@ -3,6 +3,8 @@ import uuid
 from dotenv import load_dotenv
 from pathlib import Path
 
+from database import database_url, engine_options, replica_urls
+
 BASE_DIR = Path(__file__).resolve().parent
 VOLC_BASE_URL = "wss://openspeech.bytedance.com/api/v3/realtime/dialogue"
 VOLC_APP_ID = os.getenv("VOLC_APP_ID", "")
@@ -15,14 +17,15 @@ def load_config():
     env_file = ".env.production" if os.getenv("FLASK_ENV") == "production" else ".env.development"
     load_dotenv(BASE_DIR / env_file)
 
-    # 拼接数据库连接字符串
-    db_uri = (
-        f"mysql+pymysql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}"
-        f"@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
-    )
+    # 连接串与连接池参数统一由 database.py 提供；从库注册为 replica-N 绑定，由 app.models.routing 分流只读查询
+    db_uri = database_url()
 
     return {
         "SQLALCHEMY_DATABASE_URI": db_uri,
+        "SQLALCHEMY_ENGINE_OPTIONS": engine_options(db_uri),
+        "SQLALCHEMY_BINDS": {
+            f"replica-{i}": {"url": url, **engine_options(url)} for i, url in enumerate(replica_urls())
+        },
         "SQLALCHEMY_TRACK_MODIFICATIONS": False,
         "SECRET_KEY": os.getenv("SECRET_KEY", "fallback-secret"),  # ⭐ 全局密钥
         "JSON_AS_ASCII": False,
@@ -1,20 +1,61 @@
 import os
+from urllib.parse import quote_plus
+
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
 
 load_dotenv()  # 保证能读取 .env 中的变量
 
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
+# 全项目唯一的数据库连接配置：config.load_config（Flask-SQLAlchemy）、app.vendors.settings.Settings
+# 与本模块的 engine 都从这里取连接串与连接池参数，调优只改环境变量：
+#   DATABASE_URL                 完整连接串；未设置时由 DB_USER/DB_PASSWORD/DB_HOST/DB_PORT/DB_NAME 拼接，
+#                                此时 DB_PASSWORD 必须显式配置，代码里不带默认口令
+#   DATABASE_REPLICA_URLS        只读从库连接串，逗号分隔；为空时读写都走主库
+#   DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_TIMEOUT / DB_POOL_RECYCLE / DB_POOL_PRE_PING
+# 函数每次调用时读取环境变量，config.load_config 加载 .env.* 之后再调用即可生效。
+
+def database_url() -> str:
+    url = os.getenv("DATABASE_URL")
+    if url:
+        return url
+    password = os.getenv("DB_PASSWORD")
+    if not password:
+        raise RuntimeError("未配置数据库：请设置 DATABASE_URL 或 DB_PASSWORD")
+    return (
+        f"mysql+pymysql://{quote_plus(os.getenv('DB_USER', 'root'))}:{quote_plus(password)}"
+        f"@{os.getenv('DB_HOST', '127.0.0.1')}:{os.getenv('DB_PORT', '3307')}/{os.getenv('DB_NAME', 'shuke')}"
+        f"?charset=utf8mb4"
+    )
+
+def replica_urls() -> list:
+    return [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+
+def engine_options(url: str = None) -> dict:
+    """create_engine 的连接池参数；SQLite 不使用 QueuePool 参数"""
+    options = {
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "1") == "1",
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),  # 早于 MySQL wait_timeout 回收连接
+    }
+    if not (url or database_url()).startswith("sqlite"):
+        options.update(
+            pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+            pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "30")),  # 等待空闲连接的秒数，超时抛错而不是无限排队
+        )
+    return options
+
+def create_db_engine(url: str = None):
+    url = url or database_url()
+    return create_engine(url, **engine_options(url))
 
-SQLALCHEMY_DATABASE_URL = (
-    f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-)
+def __getattr__(name):
+    # engine / SessionLocal 首次使用时才创建，导入本模块不需要数据库驱动
+    global engine, SessionLocal
+    if name not in ("engine", "SessionLocal"):
+        raise AttributeError(name)
+    engine = globals().get("engine") or create_db_engine()
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    return globals()[name]
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_pre_ping=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
@@ -140,5 +140,11 @@ if __name__ == "__main__":
         print_socketio_map(socketio, console)
         console.print("🔧 按 Ctrl+C 退出\n", style="dim")
 
+    # 后台任务只在实际服务的进程里启动：开启 reloader 时父进程只负责监视文件、重启子进程
+    from app import start_background
+    from app.vendors.settings import Settings
+    if Settings.BACKGROUND_WORKERS and is_reloader_child:
+        start_background(app)
+
     # 启动开发服务器
     app.run(host=host, port=port, debug=debug, use_reloader=True)
@@ -0,0 +1,264 @@
+import os
+import unicodedata
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+from flask import Response, request
+from werkzeug.http import dump_options_header, http_date, parse_date, parse_range_header, quote_etag, unquote_etag
+
+from app.vendors.cdc import Segment, read_segments
+from app.vendors.settings import Settings
+
+# 下载响应：
+#   1) 配置了 SENDFILE_BACKEND 时只返回 X-Accel-Redirect / X-Sendfile 头，字节由 nginx 等前端直接发送
+#   2) 否则自己处理 Range（单段/多段），整段发送时交给 wsgi.file_wrapper（gunicorn 下即 os.sendfile 零拷贝）
+
+_CONTROL_CHARS = dict.fromkeys([*range(32), 127])
+
+def _content_disposition(as_attachment: bool, download_name: Optional[str]) -> Optional[str]:
+    if not as_attachment and not download_name:
+        return None
+    kind = "attachment" if as_attachment else "inline"
+    if not download_name:
+        return kind
+    # 与 send_file 一致：先去掉控制字符（CR/LF 会拆出新的响应头），引号与反斜杠由 dump_options_header 转义
+    download_name = download_name.translate(_CONTROL_CHARS)
+    try:
+        download_name.encode("ascii")
+        names = {"filename": download_name}
+    except UnicodeEncodeError:
+        ascii_name = unicodedata.normalize("NFKD", download_name).encode("ascii", "ignore").decode("ascii")
+        names = {"filename": ascii_name or "download", "filename*": f"UTF-8''{quote(download_name, safe='!#$&+^`|~')}"}
+    return dump_options_header(kind, names)
+
+def is_not_modified(etag: Optional[str], last_modified: Optional[datetime]) -> bool:
+    if_none_match = request.if_none_match
+    if etag and if_none_match:
+        return if_none_match.contains(etag) or if_none_match.star_tag
+    ims = request.if_modified_since
+    if last_modified is not None and ims is not None:
+        return last_modified.replace(microsecond=0) <= ims
+    return False
+
+def _if_range_matches(etag: Optional[str], last_modified: Optional[datetime]) -> bool:
+    raw = request.headers.get("If-Range")
+    if not raw:
+        return True
+    if raw.startswith('"') or raw.startswith("W/"):
+        tag, weak = unquote_etag(raw)
+        return bool(etag) and not weak and tag == etag
+    date = parse_date(raw)
+    return date is not None and last_modified is not None and last_modified.replace(microsecond=0) == date
+
+def _satisfiable_ranges(size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    解析 Range 头为 [(start, end_exclusive)]；没有 Range 或应忽略时返回 None，全部不可满足时返回 []。
+    """
+    rng = parse_range_header(request.headers.get("Range"))
+    if rng is None or rng.units != "bytes" or len(rng.ranges) > Settings.MAX_RANGES:
+        return None
+    result = []
+    for start, stop in rng.ranges:
+        if start < 0:
+            start, stop = max(size + start, 0), size
+        else:
+            stop = size if stop is None else min(stop, size)
+        if start < stop:
+            result.append((start, stop))
+    return result
+
+def _pread_iter(path: Path, start: int, length: int, block_size: int) -> Iterator[bytes]:
+    # 先打开再返回生成器：文件缺失在构造响应时就抛 FileNotFoundError，而不是发到一半才失败
+    fd = os.open(path, os.O_RDONLY)
+    return _pread_gen(fd, start, length, block_size)
+
+def _pread_gen(fd: int, start: int, length: int, block_size: int) -> Iterator[bytes]:
+    try:
+        offset, remaining = start, length
+        while remaining > 0:
+            data = os.pread(fd, min(block_size, remaining), offset)
+            if not data:
+                break
+            offset += len(data)
+            remaining -= len(data)
+            yield data
+    finally:
+        os.close(fd)
+
+def _range_body(path: Path, start: int, length: int, to_eof: bool):
+    # 发到文件末尾（整文件 / 断点续传的 bytes=N-）或服务器按 Content-Length 截断时，交给 file_wrapper 零拷贝
+    wrapper = request.environ.get("wsgi.file_wrapper")
+    if wrapper is not None and (to_eof or Settings.FILE_WRAPPER_HONORS_LENGTH):
+        f = open(path, "rb")
+        f.seek(start)
+        return wrapper(f, Settings.CHUNK_SIZE)
+    return _pread_iter(path, start, length, Settings.CHUNK_SIZE)
+
+def _multipart_body(path: Path, ranges: List[Tuple[int, int]], size: int, mimetype: str, base: int = 0, segments: Sequence[Segment] = ()) -> Tuple[Iterator[bytes], int, str]:
+    boundary = uuid.uuid4().hex
+    heads = [
+        (
+            f"\r\n--{boundary}\r\nContent-Type: {mimetype}\r\n"
+            f"Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n"
+        ).encode("latin-1")
+        for start, stop in ranges
+    ]
+    tail = f"\r\n--{boundary}--\r\n".encode("latin-1")
+    total = sum(len(h) for h in heads) + sum(stop - start for start, stop in ranges) + len(tail)
+
+    if segments:
+        bodies = [read_segments(segments, start, stop - start, Settings.CHUNK_SIZE) for start, stop in ranges]
+
+        def generate_segments():
+            for head, body in zip(heads, bodies):
+                yield head
+                yield from body
+            yield tail
+
+        return generate_segments(), total, boundary
+
+    fd = os.open(path, os.O_RDONLY)
+
+    def generate():
+        try:
+            for head, (start, stop) in zip(heads, ranges):
+                yield head
+                offset, remaining = base + start, stop - start
+                while remaining > 0:
+                    data = os.pread(fd, min(Settings.CHUNK_SIZE, remaining), offset)
+                    if not data:
+                        break
+                    offset += len(data)
+                    remaining -= len(data)
+                    yield data
+            yield tail
+        finally:
+            os.close(fd)
+
+    return generate(), total, boundary
+
+def _accel_location(path: Path) -> Optional[str]:
+    resolved = path.resolve()
+    prefix = Settings.ACCEL_REDIRECT_PREFIX.rstrip("/")
+    candidates = [(Settings.STORAGE_DIR, prefix)] + [
+        (root, f"{prefix}-{i}") for i, (root, _) in enumerate(Settings.STORAGE_ROOTS)
+    ]
+    for root, root_prefix in candidates:
+        try:
+            rel = resolved.relative_to(root)
+        except ValueError:
+            continue
+        return f"{root_prefix}/{quote(rel.as_posix())}"
+    return None
+
+def _offload_header(path: Path) -> Optional[Tuple[str, str]]:
+    backend = Settings.SENDFILE_BACKEND
+    if backend == "x-sendfile":
+        return "X-Sendfile", str(path)
+    if backend == "x-accel-redirect":
+        location = _accel_location(path)
+        return ("X-Accel-Redirect", location) if location else None
+    return None
+
+def _cache_headers(etag: Optional[str], last_modified: Optional[datetime], max_age: int, immutable: bool) -> dict:
+    cache_control = f"public, max-age={max_age}" + (", immutable" if immutable else "")
+    headers = {"Accept-Ranges": "bytes", "Cache-Control": cache_control}
+    if etag:
+        headers["ETag"] = quote_etag(etag)
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+def _as_utc(dt: Optional[datetime]) -> Optional[datetime]:
+    if dt is not None and dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt
+
+def not_modified_response(
+    etag: Optional[str],
+    last_modified: Optional[datetime] = None,
+    max_age: int = 3600,
+    immutable: bool = False,
+) -> Optional[Response]:
+    """条件请求命中时返回 304，否则返回 None；只依赖元数据，不访问磁盘"""
+    last_modified = _as_utc(last_modified)
+    if not is_not_modified(etag, last_modified):
+        return None
+    return Response(status=304, headers=_cache_headers(etag, last_modified, max_age, immutable))
+
+def send_stored_file(
+    path: Path,
+    size: int,
+    mimetype: str,
+    as_attachment: bool = False,
+    download_name: Optional[str] = None,
+    last_modified: Optional[datetime] = None,
+    etag: Optional[str] = None,
+    max_age: int = 3600,
+    immutable: bool = False,
+    content_encoding: Optional[str] = None,
+    vary: Optional[str] = None,
+    offset: Optional[int] = None,
+    segments: Sequence[Segment] = (),
+) -> Response:
+    """
+    etag 传强校验值（存储的 sha256）时，条件请求在访问磁盘之前就以 304 返回。
+    immutable 用于内容寻址的 URL：内容永不变化，浏览器无需再校验。
+    offset 非空表示内容是 path 中从 offset 起的 size 字节（打包存储），此时不卸载给前端代理。
+    segments 非空表示内容由这些分块按序拼接（分块存储），path 不使用，同样不卸载。
+    """
+    not_modified = not_modified_response(etag, last_modified, max_age, immutable)
+    if not_modified is not None:
+        if vary:
+            not_modified.headers["Vary"] = vary
+        return not_modified
+
+    last_modified = _as_utc(last_modified)
+    headers = _cache_headers(etag, last_modified, max_age, immutable)
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    if vary:
+        headers["Vary"] = vary
+    disposition = _content_disposition(as_attachment, download_name)
+    if disposition:
+        headers["Content-Disposition"] = disposition
+
+    offload = _offload_header(path) if offset is None and not segments else None
+    if offload is not None:
+        # 由前端代理负责 Range 与发送，Python 只给出位置
+        headers[offload[0]] = offload[1]
+        return Response(status=200, headers=headers, mimetype=mimetype)
+
+    ranges = _satisfiable_ranges(size) if _if_range_matches(etag, last_modified) else None
+    if ranges is not None and not ranges:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status=416, headers=headers)
+
+    # 打包存储的对象后面还有别的数据，只有独立文件才能“发到文件末尾”；分块存储按清单逐块读
+    base, standalone = offset or 0, offset is None
+
+    def body_for(start: int, stop: int):
+        if segments:
+            return read_segments(segments, start, stop - start, Settings.CHUNK_SIZE)
+        return _range_body(path, base + start, stop - start, standalone and stop == size)
+
+    if not ranges:
+        rv = Response(body_for(0, size), status=200, headers=headers, mimetype=mimetype, direct_passthrough=True)
+        rv.content_length = size
+        return rv
+
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+        rv = Response(body_for(start, stop), status=206, headers=headers, mimetype=mimetype, direct_passthrough=True)
+        rv.content_length = stop - start
+        return rv
+
+    body, total, boundary = _multipart_body(path, ranges, size, mimetype, base, segments)
+    rv = Response(body, status=206, headers=headers, direct_passthrough=True)
+    rv.headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+    rv.content_length = total
+    return rv
@@ -1,4 +1,9 @@
+import base64
+import json
+from datetime import datetime
+
 from flask import request
+from sqlalchemy import and_, or_, text
 from utils.response import error_response  # 假设你项目中有统一响应工具
 
 def paginate(query, default_page_num=1, default_page_size=10, max_page_size=100):
@@ -29,4 +34,92 @@ def paginate(query, default_page_num=1, default_page_size=10, max_page_size=100)
         return error_response(f"pageNum 超出最大页数（{total_pages}），请检查参数顺序是否错误")
 
     items = query.offset((page_num - 1) * page_size).limit(page_size).all()
-    return items, total
\ No newline at end of file
+    return items, total
+
+
+# -------------------------
+# 游标分页（keyset）：按排序列的上一页末行取值继续，不用 OFFSET，深翻页与首页代价相同
+# -------------------------
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+def _decode_value(value):
+    if isinstance(value, dict) and "dt" in value:
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+def encode_cursor(values) -> str:
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = [_decode_value(v) for v in json.loads(raw)]
+    except (ValueError, TypeError):
+        raise ValueError("cursor 无效")
+    if len(values) != size:
+        raise ValueError("cursor 无效")
+    return values
+
+def _after(columns, values, descending: bool):
+    # 展开成 (a < x) OR (a = x AND b < y) ...，比行值比较更容易被各数据库用上联合索引
+    clauses = []
+    for i, (col, value) in enumerate(zip(columns, values)):
+        cmp = col < value if descending else col > value
+        clauses.append(and_(*[c == v for c, v in zip(columns[:i], values[:i])], cmp))
+    return or_(*clauses)
+
+def approximate_count(query) -> int:
+    """MySQL 下读取 information_schema 的估算行数（忽略过滤条件），其它数据库退回精确 count"""
+    session = query.session
+    bind = session.get_bind()
+    if bind.dialect.name == "mysql":
+        table = query.column_descriptions[0]["entity"].__table__.name
+        estimate = session.execute(
+            text(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t"
+            ),
+            {"t": table},
+        ).scalar()
+        if estimate is not None:
+            return int(estimate)
+    return query.order_by(None).count()
+
+def paginate_keyset(query, columns, descending=True, default_page_size=20, max_page_size=100):
+    """
+    请求参数：cursor（上一页返回的 next_cursor，首页不传）、pageSize、total（exact / approx，不传则不统计）。
+    columns 为排序列，最后一列必须唯一（通常是主键）。
+    返回 (items, next_cursor, total)；没有下一页时 next_cursor 为 None。参数错误抛 ValueError。
+    """
+    try:
+        page_size = int(request.args.get("pageSize", default_page_size))
+    except ValueError:
+        raise ValueError("分页参数类型错误：pageSize 必须是整数")
+    if page_size < 1:
+        raise ValueError("分页参数必须为正整数")
+    if page_size > max_page_size:
+        raise ValueError(f"单页最多支持 {max_page_size} 条数据")
+
+    total_mode = request.args.get("total")
+    total = None
+    if total_mode == "exact":
+        total = query.order_by(None).count()
+    elif total_mode == "approx":
+        total = approximate_count(query)
+
+    cursor = request.args.get("cursor")
+    if cursor:
+        query = query.filter(_after(columns, decode_cursor(cursor, len(columns)), descending))
+    order = [c.desc() if descending else c.asc() for c in columns]
+    rows = query.order_by(*order).limit(page_size + 1).all()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, c.key) for c in columns])
+    return rows, next_cursor, total